@@ -0,0 +1,57 @@
+import argparse
+import os
+import pendulum
+from pathlib import Path
+
+from scrape_projects.connections import DEFAULT_POOL_SIZE, configure_pool
+from scrape_projects.metrics import metrics
+from scrape_projects.tinybird import TinyBirdApi
+from scrape_projects.valorant import (
+    ValorantMatches,
+    ValorantResults,
+    ValorantStatistics,
+    cache_from_env,
+)
+from scrape_projects.valorant.backfill import BackfillCheckpoint, BackfillRunner
+
+parser = argparse.ArgumentParser(
+    description="Scrape and upload every vlr.gg match played between two UTC days"
+)
+parser.add_argument("start", type=pendulum.parse, help="first day, e.g. 2022-06-01")
+parser.add_argument("end", type=pendulum.parse, help="last day, e.g. 2022-09-30")
+parser.add_argument("--checkpoint", type=Path, default=Path("backfill.sqlite3"))
+parser.add_argument("--concurrency", type=int, default=8)
+parser.add_argument("--prefetch", type=int, default=2)
+parser.add_argument(
+    "--parse-workers", type=int, default=int(os.environ.get("VLR_PARSE_WORKERS", 0))
+)
+args = parser.parse_args()
+
+# a connection for every match page and results page that can be in flight
+configure_pool(pool_size=max(DEFAULT_POOL_SIZE, args.concurrency + args.prefetch))
+consumer = ValorantStatistics(cache=cache_from_env())
+results_scraper = ValorantResults(consumer=consumer)
+matches_scraper = ValorantMatches(
+    config_path=Path(__file__).parent
+    / "scrape_projects"
+    / "valorant"
+    / "configs"
+    / "vlr-gg-matches.yml",
+    consumer=consumer,
+    parse_workers=args.parse_workers,
+)
+checkpoint = BackfillCheckpoint(args.checkpoint)
+
+try:
+    BackfillRunner(
+        results_scraper,
+        matches_scraper,
+        TinyBirdApi(os.environ.get("TB_API_TOKEN")),
+        checkpoint,
+        concurrency=args.concurrency,
+        prefetch=args.prefetch,
+    ).run(args.start.date(), args.end.date())
+finally:
+    checkpoint.close()
+    matches_scraper.close()
+    metrics.write_from_env("valorant_backfill")
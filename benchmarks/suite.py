@@ -0,0 +1,358 @@
+"""
+Offline benchmark suite over the pages in benchmarks/fixtures and synthetic
+items. Every stage is timed (best ms per call over several rounds, as timeit
+recommends) and its peak memory is measured with tracemalloc in a separate run
+(python allocations only, memory held by libxml2 is not traced). The results
+are compared with a stored baseline and the exit code is 1 when a stage got
+slower or hungrier than the baseline by more than the threshold and by more
+than the noise floor. A stage beyond both is measured again (--retries) before
+it counts as a regression, so a single noisy run does not fail the suite.
+Run it as a module from the repository root so scrape_projects is importable:
+
+    python -m benchmarks.suite                    # compare with baseline.json
+    python -m benchmarks.suite --update-baseline  # store the current numbers
+
+Baselines are only comparable on the machine they were recorded on.
+"""
+import argparse
+import json
+import parsel
+import pendulum
+import sys
+import time
+import tracemalloc
+
+from loguru import logger
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+from scrape_projects.valorant import ValorantMatches, parse_results_page
+from scrape_projects.valorant.items import PlayerResult, TeamResult, ValorantResultItem
+
+FIXTURES = Path(__file__).parent / "fixtures"
+BASELINE = Path(__file__).parent / "baseline.json"
+TIMEZONE = pendulum.timezone("Europe/Berlin")
+# rows built and exported per call by the items/* stages
+ITEM_ROWS = 1000
+
+
+def percentage(value: Any) -> str:
+    return "" if value is None else f"{value}%"
+
+
+def player_items(match_data: Dict[str, Any]) -> List[PlayerResult]:
+    """
+    Rebuilds the raw (string) player items behind the exported rows
+    """
+    return [
+        PlayerResult(
+            row["match_id"],
+            row["game_id"],
+            row["team_id"],
+            row["player_id"],
+            row["player_name"],
+            row["agent"],
+            *[
+                str(row[stat])
+                for stat in (
+                    "kills",
+                    "deaths",
+                    "assists",
+                    "first_bloods",
+                    "first_deaths",
+                    "acs",
+                )
+            ],
+            percentage(row["kast"]),
+            str(row["adr"]),
+            percentage(row["hs"]),
+        )
+        for game in match_data["games"]
+        for row in game["player_results"]
+    ]
+
+
+def team_items(match_data: Dict[str, Any]) -> List[TeamResult]:
+    return [
+        TeamResult(
+            row["match_id"],
+            row["patch"],
+            row["game_id"],
+            row["team_id"],
+            row["team_name"],
+            "score mod-win" if row["result"] else "score",
+            str(row["score"]),
+            str(row["defense_score"]),
+            str(row["attack_score"]),
+            "mod-ct" if row["start_side"] else "mod-t",
+        )
+        for game in match_data["games"]
+        for row in game["team_results"]
+    ]
+
+
+def player_row(index: int) -> PlayerResult:
+    return PlayerResult(
+        1000 + index // 50,
+        index // 10,
+        index % 2,
+        index,
+        f"player{index}",
+        "jett",
+        "21",
+        "14",
+        "5",
+        "3",
+        "2",
+        "251",
+        "76%",
+        "163",
+        "27%",
+    )
+
+
+def team_row(index: int) -> TeamResult:
+    return TeamResult(
+        1000 + index // 50,
+        5.07,
+        index // 10,
+        index % 2,
+        f"team{index}",
+        "team mod-win",
+        "13",
+        "7",
+        "6",
+        "mod-ct",
+    )
+
+
+def result_item(index: int) -> ValorantResultItem:
+    return ValorantResultItem(
+        link=f"/{index}/alpha-vs-beta",
+        start_date="Fri, October 14, 2022",
+        start_time="10:00 PM",
+        player_stats="Player",
+        map_stats="Map",
+        stakes="Grand Final",
+        status="Completed",
+        event="Champions Tour",
+        current_timezone=TIMEZONE,
+    )
+
+
+def build_stages() -> Dict[str, Callable[[], Any]]:
+    scraper = ValorantMatches()
+    stages: Dict[str, Callable[[], Any]] = {}
+
+    for fixture in sorted(FIXTURES.glob("results_*.html")):
+        text = fixture.read_text()
+        items = parse_results_page(text, TIMEZONE)
+        stages[f"{fixture.stem}/parse"] = lambda text=text: parse_results_page(
+            text, TIMEZONE
+        )
+        stages[f"{fixture.stem}/export"] = lambda items=items: [
+            item.process_item for item in items
+        ]
+
+    for fixture in sorted(FIXTURES.glob("match_*.html")):
+        text = fixture.read_text()
+        selector = parsel.Selector(text)
+        match_data = scraper.parse_match_page(1, text)
+        stages[f"{fixture.stem}/parse"] = lambda text=text: scraper.parse_match_page(
+            1, text
+        )
+        stages[f"{fixture.stem}/selectors"] = lambda selector=selector: {
+            name: config.get(selector, process_text=True)
+            for name, config in scraper.leaf_selectors.items()
+        }
+        if match_data["games"]:
+            players = player_items(match_data)
+            teams = team_items(match_data)
+            stages[f"{fixture.stem}/player_export"] = lambda players=players: [
+                item.export() for item in players
+            ]
+            stages[f"{fixture.stem}/team_export"] = lambda teams=teams: [
+                item.export for item in teams
+            ]
+
+    # building and exporting ITEM_ROWS items, as the scrapers do for every row
+    stages["items/player_export"] = lambda: [
+        player_row(index).export() for index in range(ITEM_ROWS)
+    ]
+    stages["items/team_export"] = lambda: [
+        team_row(index).export for index in range(ITEM_ROWS)
+    ]
+    stages["items/results_export"] = lambda: [
+        result_item(index).process_item for index in range(ITEM_ROWS)
+    ]
+
+    return stages
+
+
+def reference() -> int:
+    """
+    Fixed workload timed alongside every stage, the ratio between both cancels
+    out how fast the (shared) machine happens to be while the stage runs
+    """
+    return sum(index * index for index in range(10_000))
+
+
+def calls_per_round(stage: Callable[[], Any], min_round_time: float) -> int:
+    # calibrate the calls per round so that short stages are not all timer noise
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            stage()
+        if time.perf_counter() - start >= min_round_time:
+            return number
+        number *= 2
+
+
+def measure(
+    stage: Callable[[], Any], rounds: int, min_round_time: float
+) -> Dict[str, float]:
+    numbers = {
+        stage: calls_per_round(stage, min_round_time),
+        reference: calls_per_round(reference, min_round_time),
+    }
+    timings: Dict[Callable[[], Any], List[float]] = {stage: [], reference: []}
+    for _ in range(rounds):
+        # interleaved so that both see the same slowdowns
+        for timed, number in numbers.items():
+            start = time.perf_counter()
+            for _ in range(number):
+                timed()
+            timings[timed].append((time.perf_counter() - start) / number)
+
+    tracemalloc.start()
+    stage()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "ms": min(timings[stage]) * 1000,
+        "reference_ms": min(timings[reference]) * 1000,
+        "peak_kib": peak / 1024,
+    }
+
+
+def expected_now(
+    result: Dict[str, float], expected: Dict[str, float]
+) -> Dict[str, float]:
+    """
+    Baseline of a stage with its time scaled to the current machine speed
+    """
+    scale = result["reference_ms"] / expected["reference_ms"]
+    return expected | {"ms": expected["ms"] * scale}
+
+
+def regressions(
+    name: str,
+    result: Dict[str, float],
+    expected: Dict[str, float],
+    args: argparse.Namespace,
+) -> List[str]:
+    """
+    The measures of a stage beyond both the relative threshold and the
+    absolute noise floor of the (speed scaled) baseline
+    """
+    expected = expected_now(result, expected)
+    found = []
+    for key, floor, label in (
+        ("ms", args.noise_floor_ms, "time"),
+        ("peak_kib", args.noise_floor_kib, "peak memory"),
+    ):
+        increase = result[key] - expected[key]
+        if increase > expected[key] * args.threshold and increase > floor:
+            found.append(f"{name} {label} {increase / expected[key]:+.1%}")
+    return found
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--baseline", type=Path, default=BASELINE)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.25,
+        help="allowed relative increase over the baseline (default 0.25)",
+    )
+    parser.add_argument(
+        "--noise-floor-ms",
+        type=float,
+        default=0.25,
+        help="time increases below this are noise (default 0.25)",
+    )
+    parser.add_argument(
+        "--noise-floor-kib",
+        type=float,
+        default=4.0,
+        help="peak memory increases below this are noise (default 4)",
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=2,
+        help="times a stage beyond the limits is measured again (default 2)",
+    )
+    parser.add_argument("--rounds", type=int, default=7)
+    parser.add_argument("--min-round-time", type=float, default=0.1)
+    parser.add_argument(
+        "--stage", action="append", help="only run stages starting with"
+    )
+    args = parser.parse_args()
+
+    logger.remove()
+    baseline = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+    results = {}
+    found = []
+
+    print(
+        f"{'stage':<36} {'ms/call':>9} {'base':>9} {'change':>8} {'peak KiB':>9} {'base':>9}"
+    )
+    for name, stage in build_stages().items():
+        if args.stage and not any(name.startswith(prefix) for prefix in args.stage):
+            continue
+        result = results[name] = measure(stage, args.rounds, args.min_round_time)
+        expected = baseline.get(name)
+        if expected is None:
+            print(
+                f"{name:<36} {result['ms']:9.3f} {'-':>9} {'-':>8} {result['peak_kib']:9.0f} {'-':>9}"
+            )
+            continue
+
+        for _ in range(args.retries):
+            if args.update_baseline or not regressions(name, result, expected, args):
+                break
+            again = measure(stage, args.rounds, args.min_round_time)
+            if (
+                again["ms"] / again["reference_ms"]
+                < result["ms"] / result["reference_ms"]
+            ):
+                result = results[name] = again | {"peak_kib": result["peak_kib"]}
+
+        scaled = expected_now(result, expected)
+        change = result["ms"] / scaled["ms"] - 1
+        print(
+            f"{name:<36} {result['ms']:9.3f} {scaled['ms']:9.3f} {change:+8.1%} "
+            f"{result['peak_kib']:9.0f} {expected['peak_kib']:9.0f}"
+        )
+        found += regressions(name, result, expected, args)
+
+    if args.update_baseline:
+        args.baseline.write_text(
+            json.dumps(baseline | results, indent=2, sort_keys=True) + "\n"
+        )
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if found:
+        print(f"Regressions beyond {args.threshold:.0%}:", *found, sep="\n  ")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
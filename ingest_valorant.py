@@ -0,0 +1,70 @@
+import argparse
+import os
+import signal
+from pathlib import Path
+
+from scrape_projects.metrics import metrics
+from scrape_projects.tinybird import TinyBirdApi
+from scrape_projects.valorant import (
+    ValorantMatches,
+    ValorantResults,
+    VLR_POLL_CACHE_POLICIES,
+    ValorantStatistics,
+    cache_from_env,
+)
+from scrape_projects.valorant.daemon import IngestionDaemon
+from scrape_projects.valorant.pipeline import match_index_from_env
+
+parser = argparse.ArgumentParser(
+    description="Poll vlr.gg for finished matches and upload them as they appear"
+)
+parser.add_argument(
+    "--interval",
+    type=float,
+    default=float(os.environ.get("VLR_POLL_INTERVAL", 300)),
+    help="seconds between two polls of the results page (default 300)",
+)
+parser.add_argument("--max-pages", type=int, default=3)
+parser.add_argument("--concurrency", type=int, default=4)
+parser.add_argument(
+    "--no-seed",
+    action="store_true",
+    help="upload the results already listed at startup instead of skipping them",
+)
+args = parser.parse_args()
+
+tinybird = TinyBirdApi(os.environ.get("TB_API_TOKEN"))
+match_index = match_index_from_env(tinybird)
+
+consumer = ValorantStatistics(cache=cache_from_env(policies=VLR_POLL_CACHE_POLICIES))
+results_scraper = ValorantResults(consumer=consumer)
+matches_scraper = ValorantMatches(
+    config_path=Path(__file__).parent
+    / "scrape_projects"
+    / "valorant"
+    / "configs"
+    / "vlr-gg-matches.yml",
+    consumer=consumer,
+    parse_workers=int(os.environ.get("VLR_PARSE_WORKERS", 0)),
+    match_index=match_index,
+)
+
+daemon = IngestionDaemon(
+    results_scraper,
+    matches_scraper,
+    tinybird,
+    interval=args.interval,
+    max_pages=args.max_pages,
+    concurrency=args.concurrency,
+    seed=not args.no_seed,
+)
+for signum in (signal.SIGINT, signal.SIGTERM):
+    signal.signal(signum, lambda *_: daemon.stop())
+
+try:
+    daemon.run()
+finally:
+    results_scraper.close()
+    matches_scraper.close()
+    match_index.close()
+    metrics.write_from_env("valorant_daemon")
@@ -0,0 +1,307 @@
+import dataclasses
+import json
+import re
+import sqlite3
+import threading
+import time
+import zlib
+
+from http import HTTPStatus
+from pathlib import Path
+from requests import PreparedRequest, Response, Session
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.exceptions import ConnectionError
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+from typing import Iterable, List, Optional, Union
+
+# statuses worth replaying, permanent redirects are kept so that a cached
+# https://vlr.gg/... request can still be followed to https://www.vlr.gg/...
+CACHEABLE_STATUS_CODES = (200, 301, 308)
+
+# the stored body is already decoded, these headers would describe the wire format
+DROPPED_HEADERS = ("content-encoding", "content-length", "transfer-encoding")
+
+# response validator -> conditional request header sent to revalidate it
+VALIDATOR_HEADERS = (("ETag", "If-None-Match"), ("Last-Modified", "If-Modified-Since"))
+
+
+class CacheMissError(ConnectionError):
+    """
+    Raised in replay only mode when a request is not available in the cache
+    """
+
+
+@dataclasses.dataclass
+class CachePolicy:
+    """
+    Cache rule for every url whose path (including the query) matches pattern,
+    ttl is given in seconds and None means the response never expires
+    """
+
+    pattern: str
+    ttl: Optional[float] = None
+
+    def matches(self, path_url: str) -> bool:
+        return re.search(self.pattern, path_url) is not None
+
+
+@dataclasses.dataclass
+class CachedResponse:
+    url: str
+    status_code: int
+    headers: dict
+    body: bytes
+    stored_at: float
+    expired: bool = False
+
+    def conditional_headers(self) -> dict:
+        """
+        Headers turning a request for this response into a conditional one,
+        empty when the server sent no validators
+        """
+        headers = CaseInsensitiveDict(self.headers)
+        return {
+            condition: headers[validator]
+            for validator, condition in VALIDATOR_HEADERS
+            if validator in headers
+        }
+
+
+class ResponseCache:
+    """
+    Persistent response cache keyed by url and backed by a single sqlite file
+    (":memory:" keeps it in process). Bodies are stored zlib compressed, entries
+    expire according to the first matching CachePolicy and the least recently
+    used entries are evicted once the stored bodies exceed max_size bytes.
+    Expired entries are revalidated with a conditional request when the server
+    sent an ETag or Last-Modified header. In replay_only mode expiry is ignored
+    and nothing is ever fetched.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path] = ":memory:",
+        policies: Iterable[CachePolicy] = (),
+        max_size: Optional[int] = 1024**3,
+        replay_only: bool = False,
+    ) -> None:
+        self.path = path
+        self.policies: List[CachePolicy] = list(policies)
+        self.max_size = max_size
+        self.replay_only = replay_only
+        self._lock = threading.Lock()
+
+        if str(path) != ":memory:":
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+
+        self._connection = sqlite3.connect(str(path), check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute(
+                "create table if not exists responses ("
+                "url text primary key, status_code integer, headers text, "
+                "body blob, size integer, stored_at real, accessed_at real)"
+            )
+            self._connection.execute(
+                "create index if not exists responses_accessed_at "
+                "on responses (accessed_at)"
+            )
+
+    def get_policy(self, path_url: str) -> Optional[CachePolicy]:
+        for policy in self.policies:
+            if policy.matches(path_url):
+                return policy
+        return None
+
+    def get(
+        self, url: str, path_url: str, allow_expired: bool = False
+    ) -> Optional[CachedResponse]:
+        """
+        The stored response for url, expired ones are only returned (flagged as
+        such) with allow_expired
+        """
+        policy = self.get_policy(path_url)
+        if policy is None and not self.replay_only:
+            return None
+
+        with self._lock:
+            row = self._connection.execute(
+                "select status_code, headers, body, stored_at from responses "
+                "where url = ?",
+                (url,),
+            ).fetchone()
+            if row is None:
+                return None
+
+            status_code, headers, body, stored_at = row
+            now = time.time()
+            expired = (
+                policy is not None
+                and policy.ttl is not None
+                and now - stored_at > policy.ttl
+            )
+            expired = expired and not self.replay_only
+            if expired and not allow_expired:
+                return None
+
+            with self._connection:
+                self._connection.execute(
+                    "update responses set accessed_at = ? where url = ?", (now, url)
+                )
+
+        return CachedResponse(
+            url=url,
+            status_code=status_code,
+            headers=json.loads(headers),
+            body=zlib.decompress(body),
+            stored_at=stored_at,
+            expired=expired,
+        )
+
+    def refresh(self, url: str) -> None:
+        """
+        Marks the stored response for url as fresh again, e.g. after a 304
+        """
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "update responses set stored_at = ?, accessed_at = ? where url = ?",
+                (now, now, url),
+            )
+
+    def put(
+        self, url: str, path_url: str, status_code: int, headers: dict, body: bytes
+    ) -> bool:
+        if self.get_policy(path_url) is None:
+            return False
+        if status_code not in CACHEABLE_STATUS_CODES:
+            return False
+
+        compressed = zlib.compress(body)
+        headers = {
+            key: value
+            for key, value in headers.items()
+            if key.lower() not in DROPPED_HEADERS
+        }
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "insert or replace into responses values (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    url,
+                    status_code,
+                    json.dumps(headers),
+                    compressed,
+                    len(compressed),
+                    now,
+                    now,
+                ),
+            )
+            self._evict()
+        return True
+
+    def _evict(self) -> None:
+        if self.max_size is None:
+            return
+
+        (total_size,) = self._connection.execute(
+            "select coalesce(sum(size), 0) from responses"
+        ).fetchone()
+        if total_size <= self.max_size:
+            return
+
+        evicted = []
+        for url, size in self._connection.execute(
+            "select url, size from responses order by accessed_at"
+        ).fetchall():
+            if total_size <= self.max_size:
+                break
+            evicted.append((url,))
+            total_size -= size
+
+        self._connection.executemany("delete from responses where url = ?", evicted)
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+
+class CachingAdapter(BaseAdapter):
+    """
+    Transport adapter answering GET requests from a ResponseCache and sending
+    everything else through the wrapped adapter. Expired responses with
+    validators are revalidated, a 304 is answered with the stored response
+    flagged as X-Cache: REVALIDATED.
+    """
+
+    def __init__(
+        self, cache: ResponseCache, adapter: Optional[BaseAdapter] = None
+    ) -> None:
+        super().__init__()
+        self.cache = cache
+        self.adapter = adapter or HTTPAdapter()
+
+    def send(self, request: PreparedRequest, **kwargs) -> Response:
+        if request.method != "GET":
+            return self.adapter.send(request, **kwargs)
+
+        cached = self.cache.get(request.url, request.path_url, allow_expired=True)
+        if cached is not None and not cached.expired:
+            return self.build_response(request, cached)
+
+        if self.cache.replay_only:
+            raise CacheMissError(
+                f"{request.url} is not cached and replay only mode is enabled",
+                request=request,
+            )
+
+        conditional_headers = cached.conditional_headers() if cached else {}
+        if conditional_headers:
+            request = request.copy()
+            request.headers.update(conditional_headers)
+
+        response = self.adapter.send(request, **kwargs)
+        if response.status_code == HTTPStatus.NOT_MODIFIED and conditional_headers:
+            response.close()
+            self.cache.refresh(request.url)
+            revalidated = self.build_response(request, cached, "REVALIDATED")
+            revalidated.elapsed = response.elapsed
+            return revalidated
+
+        self.cache.put(
+            request.url,
+            request.path_url,
+            response.status_code,
+            dict(response.headers),
+            response.content,
+        )
+        return response
+
+    def build_response(
+        self, request: PreparedRequest, cached: CachedResponse, status: str = "HIT"
+    ) -> Response:
+        response = Response()
+        response.status_code = cached.status_code
+        response.headers = CaseInsensitiveDict(cached.headers)
+        response.headers["X-Cache"] = status
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.url = request.url
+        response.request = request
+        response.reason = HTTPStatus(cached.status_code).phrase
+        response._content = cached.body
+        response._content_consumed = True
+        return response
+
+    def close(self) -> None:
+        self.adapter.close()
+
+
+def mount_cache(
+    session: Session, cache: ResponseCache, prefixes: Iterable[str]
+) -> Session:
+    """
+    Routes every request starting with one of the given prefixes through cache
+    """
+    for prefix in prefixes:
+        session.mount(prefix, CachingAdapter(cache, session.get_adapter(prefix)))
+    return session
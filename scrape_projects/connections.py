@@ -0,0 +1,111 @@
+import os
+import threading
+
+from requests import PreparedRequest, Response, Session
+from requests.adapters import HTTPAdapter
+from typing import Optional, Tuple
+
+# enough connections per host for the default scraping concurrency (8) plus
+# the probing headroom of the rate limiter
+DEFAULT_POOL_SIZE = 16
+# vlr.gg, www.vlr.gg, api.tinybird.co, api.ipgeolocation.io and a few spare
+DEFAULT_POOL_HOSTS = 8
+DEFAULT_CONNECT_TIMEOUT = 5.0
+DEFAULT_READ_TIMEOUT = 30.0
+
+# requests decodes these transparently (br only when brotli is installed)
+ACCEPT_ENCODING = "gzip, deflate"
+
+
+class PooledAdapter(HTTPAdapter):
+    """
+    HTTPAdapter keeping up to pool_size keep-alive connections for each of
+    pool_hosts hosts. pool_block makes requests beyond pool_size wait for a free
+    connection instead of opening (and throwing away) extra sockets. Requests
+    sent without a timeout get (connect_timeout, read_timeout).
+    """
+
+    def __init__(
+        self,
+        pool_size: int = DEFAULT_POOL_SIZE,
+        pool_hosts: int = DEFAULT_POOL_HOSTS,
+        connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+        read_timeout: float = DEFAULT_READ_TIMEOUT,
+    ) -> None:
+        self.timeout: Tuple[float, float] = (connect_timeout, read_timeout)
+        super().__init__(
+            pool_connections=pool_hosts, pool_maxsize=pool_size, pool_block=True
+        )
+
+    def send(self, request: PreparedRequest, **kwargs) -> Response:
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        return super().send(request, **kwargs)
+
+
+def adapter_from_env(
+    pool_size: Optional[int] = None,
+    connect_timeout: Optional[float] = None,
+    read_timeout: Optional[float] = None,
+) -> PooledAdapter:
+    """
+    PooledAdapter with the given settings, missing ones come from
+    SCRAPE_POOL_SIZE, SCRAPE_CONNECT_TIMEOUT and SCRAPE_READ_TIMEOUT or the
+    defaults
+    """
+    environ = os.environ
+    return PooledAdapter(
+        pool_size=pool_size or int(environ.get("SCRAPE_POOL_SIZE", DEFAULT_POOL_SIZE)),
+        connect_timeout=connect_timeout
+        or float(environ.get("SCRAPE_CONNECT_TIMEOUT", DEFAULT_CONNECT_TIMEOUT)),
+        read_timeout=read_timeout
+        or float(environ.get("SCRAPE_READ_TIMEOUT", DEFAULT_READ_TIMEOUT)),
+    )
+
+
+_shared_adapter: Optional[PooledAdapter] = None
+_shared_adapter_lock = threading.Lock()
+
+
+def configure_pool(
+    pool_size: Optional[int] = None,
+    connect_timeout: Optional[float] = None,
+    read_timeout: Optional[float] = None,
+) -> PooledAdapter:
+    """
+    Replaces the shared adapter, call it before creating any consumer (e.g.
+    with the concurrency a script was started with)
+    """
+    global _shared_adapter
+    adapter = adapter_from_env(pool_size, connect_timeout, read_timeout)
+    with _shared_adapter_lock:
+        previous, _shared_adapter = _shared_adapter, adapter
+    if previous is not None:
+        previous.close()
+    return adapter
+
+
+def shared_adapter() -> PooledAdapter:
+    """
+    The adapter (and so the connection pools) every session of the process
+    sends through, configured from the environment on first use
+    """
+    global _shared_adapter
+    with _shared_adapter_lock:
+        if _shared_adapter is None:
+            _shared_adapter = adapter_from_env()
+        return _shared_adapter
+
+
+def pooled_session() -> Session:
+    """
+    New session on top of the shared connection pools. Every consumer gets its
+    own session so hooks and the adapters mounted for a host (cache, rate
+    limiter) stay with it, while connections are reused across all of them.
+    """
+    session = Session()
+    adapter = shared_adapter()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers["Accept-Encoding"] = ACCEPT_ENCODING
+    return session
@@ -0,0 +1,189 @@
+import re
+import threading
+import time
+
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from loguru import logger
+from requests import PreparedRequest, Response, Session
+from requests.adapters import BaseAdapter, HTTPAdapter
+from typing import Deque, Iterable, List, Optional
+from urllib.parse import urlsplit
+
+from scrape_projects.metrics import metrics
+from scrape_projects.ratelimit import AdaptiveRateLimiter, parse_retry_after
+
+
+class HedgingAdapter(BaseAdapter):
+    """
+    Transport adapter sending a duplicate of a GET request whose path matches
+    pattern when it has not answered after the observed quantile (p95 by
+    default) of the latencies of the last `window` such requests, the first
+    response to arrive wins. No request is hedged before min_samples latencies
+    were observed. Hedges are capped at max_hedge_ratio of the requests (with
+    bursts of up to max_burst hedges).
+
+    Meant to be mounted below a RateLimitedAdapter: the limiter has already
+    let the request through, so the latencies only measure the wrapped adapter
+    and not the wait for a slot. A hedge is only sent when limiter has a slot
+    free right away, which is held until neither the hedge nor the request it
+    duplicates is in flight anymore, so duplicates never exceed the rate limit
+    budget nor queue behind it.
+    """
+
+    def __init__(
+        self,
+        adapter: Optional[BaseAdapter] = None,
+        limiter: Optional[AdaptiveRateLimiter] = None,
+        pattern: str = r"^/\d+/",
+        quantile: float = 0.95,
+        window: int = 200,
+        min_samples: int = 20,
+        min_delay: float = 0.5,
+        max_hedge_ratio: float = 0.05,
+        max_burst: float = 5.0,
+        max_workers: int = 32,
+    ) -> None:
+        super().__init__()
+        self.adapter = adapter or HTTPAdapter()
+        self.limiter = limiter
+        self.pattern = re.compile(pattern)
+        self.quantile = quantile
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.max_hedge_ratio = max_hedge_ratio
+        self.max_burst = max_burst
+        self.latencies: Deque[float] = deque(maxlen=window)
+        self._budget = 0.0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="hedge"
+        )
+
+    def hedge_delay(self) -> Optional[float]:
+        """
+        Seconds to wait before hedging, None while too few latencies are known
+        """
+        with self._lock:
+            if len(self.latencies) < self.min_samples:
+                return None
+            latencies = sorted(self.latencies)
+        index = min(int(self.quantile * len(latencies)), len(latencies) - 1)
+        return max(latencies[index], self.min_delay)
+
+    def take_hedge(self) -> bool:
+        with self._lock:
+            if self._budget < 1:
+                return False
+            if self.limiter is not None and not self.limiter.try_acquire():
+                return False
+            self._budget -= 1
+            return True
+
+    def send(self, request: PreparedRequest, **kwargs) -> Response:
+        if request.method != "GET" or not self.pattern.search(request.path_url):
+            return self.adapter.send(request, **kwargs)
+
+        with self._lock:
+            self._budget = min(self.max_burst, self._budget + self.max_hedge_ratio)
+        delay = self.hedge_delay()
+        if delay is None:
+            return self.attempt(request, kwargs)
+
+        primary = self._executor.submit(self.attempt, request, kwargs)
+        done, _ = wait([primary], timeout=delay)
+        if done or not self.take_hedge():
+            return primary.result()
+
+        host = urlsplit(request.url).hostname or ""
+        logger.info(f"Hedging {request.url} after {delay:.2f}s")
+        hedge_started = time.monotonic()
+        hedge = self._executor.submit(self.attempt, request.copy(), kwargs)
+        if self.limiter is not None:
+            self.release_after(hedge, hedge_started, [primary, hedge])
+        pending = {primary, hedge}
+        while True:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            # a failed attempt only loses if the other one can still answer
+            answered = [future for future in done if future.exception() is None]
+            if answered or not pending:
+                winner = (answered or list(done))[0]
+                break
+
+        for loser in pending | (done - {winner}):
+            loser.add_done_callback(close_response)
+        metrics.inc(
+            "hedge_requests_total",
+            host=host,
+            winner="hedge" if winner is hedge else "primary",
+        )
+        return winner.result()
+
+    def attempt(self, request: PreparedRequest, kwargs: dict) -> Response:
+        start = time.monotonic()
+        response = self.adapter.send(request, **kwargs)
+        if not kwargs.get("stream"):
+            # the whole body has to arrive for the response to count as answered
+            response.content
+        with self._lock:
+            self.latencies.append(time.monotonic() - start)
+        return response
+
+    def release_after(
+        self, hedge: Future, started: float, attempts: List[Future]
+    ) -> None:
+        """
+        Releases the limiter slot taken for hedge with its outcome once none of
+        attempts is in flight. The slot of the primary request is released as
+        soon as send returns, so a losing primary still on the wire keeps the
+        hedge's slot taken until it is done.
+        """
+        latency = []
+        remaining = [len(attempts)]
+        lock = threading.Lock()
+
+        def done(future: Future) -> None:
+            if future is hedge:
+                latency.append(time.monotonic() - started)
+            with lock:
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+            if hedge.exception() is not None:
+                self.limiter.release(None, latency[0])
+                return
+            response = hedge.result()
+            self.limiter.release(
+                response.status_code,
+                latency[0],
+                parse_retry_after(response.headers.get("Retry-After")),
+            )
+
+        for attempt in attempts:
+            attempt.add_done_callback(done)
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self.adapter.close()
+
+
+def close_response(future: Future) -> None:
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+
+def mount_hedging(session: Session, prefixes: Iterable[str], **options) -> Session:
+    """
+    Routes every request starting with one of the given prefixes through a
+    single HedgingAdapter built with options, so the latencies and the hedge
+    budget are shared by all of them. The prefixes must be served by the same
+    adapter.
+    """
+    prefixes = list(prefixes)
+    adapters = {id(session.get_adapter(prefix)) for prefix in prefixes}
+    if len(adapters) > 1:
+        raise ValueError(f"{prefixes} are not served by the same adapter")
+    adapter = HedgingAdapter(session.get_adapter(prefixes[0]), **options)
+    for prefix in prefixes:
+        session.mount(prefix, adapter)
+    return session
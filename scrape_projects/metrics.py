@@ -0,0 +1,318 @@
+import bisect
+import json
+import os
+import threading
+import time
+
+from contextlib import contextmanager
+from pathlib import Path
+from requests import Response, Session
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+from urllib.parse import urlsplit
+
+# upper bounds (seconds) of the latency buckets, prometheus client defaults
+# widened towards the slow end since vlr.gg pages can take a while
+DEFAULT_BUCKETS = (
+    0.001,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def label_key(labels: Dict[str, str]) -> Labels:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def format_labels(labels: Labels, extra: Optional[Dict[str, str]] = None) -> str:
+    pairs = list(labels) + list((extra or {}).items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in pairs) + "}"
+
+
+class Histogram:
+    """
+    Cumulative bucket counts, sum and count of the observed values
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        Upper bound of the bucket holding the q quantile (inf past the last one)
+        """
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def to_dict(self) -> Dict[str, Union[float, int, Dict[str, int]]]:
+        cumulative = 0
+        buckets = {}
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            cumulative += count
+            buckets["+Inf" if bound == float("inf") else str(bound)] = cumulative
+        quantiles = {
+            name: None if value == float("inf") else value
+            for name, value in (
+                ("p50", self.quantile(0.5)),
+                ("p95", self.quantile(0.95)),
+            )
+        }
+        return {"count": self.count, "sum": self.sum} | quantiles | {"buckets": buckets}
+
+
+class MetricsRegistry:
+    """
+    Thread safe counters, gauges and latency histograms keyed by name and
+    labels. The scrapers and the tinybird uploader record into the module level
+    `metrics` registry, write_json / write_prometheus dump it at the end of a run.
+    """
+
+    def __init__(self, namespace: str = "scrape") -> None:
+        self.namespace = namespace
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self._gauges: Dict[str, Dict[Labels, float]] = {}
+
+    def inc(self, name: str, value: float = 1, **labels: str) -> None:
+        key = label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels: str) -> None:
+        key = label_key(labels)
+        with self._lock:
+            self._gauges.setdefault(name, {})[key] = value
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        key = label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            if key not in series:
+                series[key] = Histogram()
+            series[key].observe(value)
+
+    @contextmanager
+    def timer(self, name: str, **labels: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def histogram(self, name: str, **labels: str) -> Optional[Histogram]:
+        key = label_key(labels)
+        with self._lock:
+            return self._histograms.get(name, {}).get(key)
+
+    def reset(self) -> None:
+        with self._lock:
+            self.started_at = time.time()
+            self._counters.clear()
+            self._histograms.clear()
+            self._gauges.clear()
+
+    def reset_after_fork(self) -> None:
+        """
+        Starts a forked child over with a new lock instead of the inherited
+        one, which a thread of the parent may have held at the time of the fork
+        """
+        self._lock = threading.Lock()
+        self.reset()
+
+    def drain(self) -> Tuple[Dict, Dict]:
+        """
+        Returns and clears the recorded series, used to ship the metrics of a
+        worker process back to the parent registry (see merge)
+        """
+        with self._lock:
+            state = (self._counters, self._histograms)
+            self._counters, self._histograms = {}, {}
+        return state
+
+    def merge(self, state: Tuple[Dict, Dict]) -> None:
+        counters, histograms = state
+        with self._lock:
+            for name, series in counters.items():
+                merged = self._counters.setdefault(name, {})
+                for key, value in series.items():
+                    merged[key] = merged.get(key, 0) + value
+            for name, series in histograms.items():
+                merged = self._histograms.setdefault(name, {})
+                for key, histogram in series.items():
+                    if key not in merged:
+                        merged[key] = Histogram(histogram.buckets)
+                    target = merged[key]
+                    target.counts = [
+                        a + b for a, b in zip(target.counts, histogram.counts)
+                    ]
+                    target.sum += histogram.sum
+                    target.count += histogram.count
+
+    def rates(self, elapsed: float) -> Dict[str, List[Dict]]:
+        """
+        Per second rate of every rows counter over the run
+        """
+        return {
+            name.replace("rows_total", "rows_per_second"): [
+                {"labels": dict(labels), "value": value / elapsed}
+                for labels, value in series.items()
+            ]
+            for name, series in self._counters.items()
+            if name.endswith("rows_total")
+        }
+
+    def to_dict(self) -> Dict[str, Dict]:
+        with self._lock:
+            elapsed = max(time.time() - self.started_at, 1e-9)
+            return {
+                "started_at": self.started_at,
+                "elapsed_seconds": elapsed,
+                "counters": {
+                    name: [
+                        {"labels": dict(labels), "value": value}
+                        for labels, value in series.items()
+                    ]
+                    for name, series in self._counters.items()
+                },
+                "gauges": {
+                    name: [
+                        {"labels": dict(labels), "value": value}
+                        for labels, value in series.items()
+                    ]
+                    for name, series in self._gauges.items()
+                },
+                "histograms": {
+                    name: [
+                        {"labels": dict(labels)} | histogram.to_dict()
+                        for labels, histogram in series.items()
+                    ]
+                    for name, series in self._histograms.items()
+                },
+                "rates": self.rates(elapsed),
+            }
+
+    def to_prometheus(self) -> str:
+        with self._lock:
+            elapsed = max(time.time() - self.started_at, 1e-9)
+            lines = []
+            for name, series in sorted(self._counters.items()):
+                metric = f"{self.namespace}_{name}"
+                lines.append(f"# TYPE {metric} counter")
+                for labels, value in series.items():
+                    lines.append(f"{metric}{format_labels(labels)} {value}")
+
+            for name, series in sorted(self._gauges.items()):
+                metric = f"{self.namespace}_{name}"
+                lines.append(f"# TYPE {metric} gauge")
+                for labels, value in series.items():
+                    lines.append(f"{metric}{format_labels(labels)} {value}")
+
+            for name, series in sorted(self.rates(elapsed).items()):
+                metric = f"{self.namespace}_{name}"
+                lines.append(f"# TYPE {metric} gauge")
+                for sample in series:
+                    labels = tuple(sample["labels"].items())
+                    lines.append(f"{metric}{format_labels(labels)} {sample['value']}")
+
+            for name, series in sorted(self._histograms.items()):
+                metric = f"{self.namespace}_{name}"
+                lines.append(f"# TYPE {metric} histogram")
+                for labels, histogram in series.items():
+                    cumulative = 0
+                    for bound, count in zip(
+                        histogram.buckets + (float("inf"),), histogram.counts
+                    ):
+                        cumulative += count
+                        le = "+Inf" if bound == float("inf") else str(bound)
+                        lines.append(
+                            f"{metric}_bucket{format_labels(labels, {'le': le})} {cumulative}"
+                        )
+                    lines.append(f"{metric}_sum{format_labels(labels)} {histogram.sum}")
+                    lines.append(
+                        f"{metric}_count{format_labels(labels)} {histogram.count}"
+                    )
+
+            lines.append(f"# TYPE {self.namespace}_run_seconds gauge")
+            lines.append(f"{self.namespace}_run_seconds {elapsed}")
+        return "\n".join(lines) + "\n"
+
+    def write_json(self, path: Union[str, Path]) -> None:
+        Path(path).write_text(json.dumps(self.to_dict(), indent=2) + "\n")
+
+    def write_prometheus(self, path: Union[str, Path]) -> None:
+        Path(path).write_text(self.to_prometheus())
+
+    def write(self, directory: Union[str, Path], name: str = "metrics") -> None:
+        """
+        Writes {directory}/{name}.json and {directory}/{name}.prom
+        """
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        self.write_json(directory / f"{name}.json")
+        self.write_prometheus(directory / f"{name}.prom")
+
+    def write_from_env(self, name: str = "metrics") -> None:
+        """
+        Writes the metrics files to SCRAPE_METRICS_DIR when it is set
+        """
+        directory = os.environ.get("SCRAPE_METRICS_DIR")
+        if directory:
+            self.write(directory, name)
+
+
+metrics = MetricsRegistry()
+
+
+def record_response(response: Response, *args, **kwargs) -> Response:
+    """
+    requests response hook recording latency, status and size of every fetch,
+    responses answered by the CachingAdapter are labelled cache="hit" (or
+    "revalidated" when the server answered a conditional request with a 304)
+    """
+    host = urlsplit(response.url).hostname or ""
+    cache = response.headers.get("X-Cache", "miss").lower()
+    metrics.observe(
+        "fetch_seconds", response.elapsed.total_seconds(), host=host, cache=cache
+    )
+    metrics.inc(
+        "fetch_requests_total", host=host, status=response.status_code, cache=cache
+    )
+    metrics.inc("fetch_bytes_total", len(response.content), host=host, cache=cache)
+    return response
+
+
+def instrument_session(session: Session) -> Session:
+    if record_response not in session.hooks["response"]:
+        session.hooks["response"].append(record_response)
+    return session
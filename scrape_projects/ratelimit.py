@@ -0,0 +1,260 @@
+import threading
+import time
+
+from email.utils import parsedate_to_datetime
+from loguru import logger
+from requests import PreparedRequest, Response, Session
+from requests.adapters import BaseAdapter, HTTPAdapter
+from typing import Iterable, Optional
+from urllib.parse import urlsplit
+
+from scrape_projects.metrics import metrics
+
+# statuses meaning "slow down", the request is retried once the limiter allows it
+THROTTLE_STATUS_CODES = (429, 503)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Seconds to wait from a Retry-After header (delay in seconds or http date)
+    """
+    if not value:
+        return None
+    if value.strip().isdigit():
+        return float(value)
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class AdaptiveRateLimiter:
+    """
+    Token bucket (rate requests per second, up to burst at once) combined with
+    a limit on the requests in flight, both adapted AIMD style: every response
+    that is neither throttled nor slower than slow_threshold seconds raises the
+    rate by rate_step and the concurrency by one per full window of successes,
+    a throttled (429/503), failed or slow response halves both (once per
+    cooldown) and a Retry-After pauses every request until it has passed.
+    Share one instance between everything that talks to the same host.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        rate: float = 2.0,
+        min_rate: float = 0.2,
+        max_rate: float = 10.0,
+        rate_step: float = 0.1,
+        concurrency: int = 4,
+        max_concurrency: int = 16,
+        burst: int = 4,
+        decrease_factor: float = 0.5,
+        slow_threshold: float = 5.0,
+        penalty: float = 1.0,
+        cooldown: float = 2.0,
+    ) -> None:
+        self.name = name
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.rate_step = rate_step
+        self.concurrency = concurrency
+        self.max_concurrency = max_concurrency
+        self.burst = burst
+        self.decrease_factor = decrease_factor
+        self.slow_threshold = slow_threshold
+        self.penalty = penalty
+        self.cooldown = cooldown
+
+        self.tokens = float(burst)
+        self.in_flight = 0
+        self.blocked_until = 0.0
+        self._successes = 0
+        self._last_refill = time.monotonic()
+        self._last_decrease = float("-inf")
+        self._condition = threading.Condition()
+        self._publish()
+
+    def acquire(self) -> float:
+        """
+        Blocks until a request may be sent, returns the time spent waiting
+        """
+        start = time.monotonic()
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                timeout = self.blocked_until - now
+                if timeout <= 0:
+                    if self.tokens < 1:
+                        timeout = (1 - self.tokens) / self.rate
+                    elif self.in_flight < self.concurrency:
+                        self.tokens -= 1
+                        self.in_flight += 1
+                        break
+                    else:
+                        # woken up by release
+                        timeout = None
+                self._condition.wait(timeout)
+
+        waited = time.monotonic() - start
+        metrics.observe("ratelimit_wait_seconds", waited, limiter=self.name)
+        return waited
+
+    def try_acquire(self) -> bool:
+        """
+        Takes a request slot only when one is free right away, for optional
+        requests that are not worth waiting for
+        """
+        with self._condition:
+            now = time.monotonic()
+            self._refill(now)
+            if (
+                self.blocked_until > now
+                or self.tokens < 1
+                or self.in_flight >= self.concurrency
+            ):
+                return False
+            self.tokens -= 1
+            self.in_flight += 1
+            return True
+
+    def release(
+        self,
+        status_code: Optional[int],
+        latency: float,
+        retry_after: Optional[float] = None,
+    ) -> None:
+        """
+        Reports the outcome of an acquired request, status_code is None when
+        the request failed without a response
+        """
+        with self._condition:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if status_code in THROTTLE_STATUS_CODES:
+                self.blocked_until = max(
+                    self.blocked_until, now + (retry_after or self.penalty)
+                )
+                self._decrease(
+                    now, "throttled", status_code, f"status code {status_code}"
+                )
+            elif status_code is None:
+                self._decrease(now, "error", status_code, "request error")
+            elif latency > self.slow_threshold:
+                self._decrease(
+                    now, "slow", status_code, f"slow response ({latency:.1f}s)"
+                )
+            else:
+                self._increase()
+            self._condition.notify_all()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(
+            self.burst, self.tokens + (now - self._last_refill) * self.rate
+        )
+        self._last_refill = now
+
+    def _increase(self) -> None:
+        self.rate = min(self.max_rate, self.rate + self.rate_step)
+        self._successes += 1
+        if self._successes >= self.concurrency:
+            self._successes = 0
+            if self.concurrency < self.max_concurrency:
+                self.concurrency += 1
+                logger.info(
+                    f"Probing {self.name}: {self.concurrency} concurrent requests "
+                    f"at {self.rate:.2f} requests/s"
+                )
+        self._publish()
+
+    def _decrease(
+        self, now: float, reason: str, status_code: Optional[int], detail: str
+    ) -> None:
+        # reason is one of throttled / error / slow, detail only goes to the log
+        metrics.inc(
+            "ratelimit_throttled_total",
+            limiter=self.name,
+            reason=reason,
+            status=status_code or "",
+        )
+        if now - self._last_decrease < self.cooldown:
+            return
+        self._last_decrease = now
+        self._successes = 0
+        self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+        self.concurrency = max(1, int(self.concurrency * self.decrease_factor))
+        self.tokens = min(self.tokens, 0.0)
+        logger.warning(
+            f"Backing off {self.name} ({detail}): {self.concurrency} concurrent "
+            f"requests at {self.rate:.2f} requests/s"
+        )
+        self._publish()
+
+    def _publish(self) -> None:
+        metrics.set_gauge("ratelimit_rate", self.rate, limiter=self.name)
+        metrics.set_gauge("ratelimit_concurrency", self.concurrency, limiter=self.name)
+
+
+class RateLimitedAdapter(BaseAdapter):
+    """
+    Transport adapter sending every request through an AdaptiveRateLimiter,
+    throttled requests are retried up to max_retries times once the limiter
+    lets them through again
+    """
+
+    def __init__(
+        self,
+        limiter: AdaptiveRateLimiter,
+        adapter: Optional[BaseAdapter] = None,
+        max_retries: int = 3,
+    ) -> None:
+        super().__init__()
+        self.limiter = limiter
+        self.adapter = adapter or HTTPAdapter()
+        self.max_retries = max_retries
+
+    def send(self, request: PreparedRequest, **kwargs) -> Response:
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire()
+            start = time.monotonic()
+            try:
+                response = self.adapter.send(request, **kwargs)
+            except Exception:
+                self.limiter.release(None, time.monotonic() - start)
+                raise
+
+            self.limiter.release(
+                response.status_code,
+                time.monotonic() - start,
+                parse_retry_after(response.headers.get("Retry-After")),
+            )
+            if (
+                response.status_code not in THROTTLE_STATUS_CODES
+                or attempt == self.max_retries
+            ):
+                return response
+
+            logger.warning(
+                f"{request.url} throttled with {response.status_code}, retrying"
+            )
+            metrics.inc(
+                "ratelimit_retries_total", host=urlsplit(request.url).hostname or ""
+            )
+            response.close()
+        return response
+
+    def close(self) -> None:
+        self.adapter.close()
+
+
+def mount_rate_limiter(
+    session: Session, limiter: AdaptiveRateLimiter, prefixes: Iterable[str]
+) -> Session:
+    """
+    Routes every request starting with one of the given prefixes through limiter
+    """
+    for prefix in prefixes:
+        session.mount(prefix, RateLimitedAdapter(limiter, session.get_adapter(prefix)))
+    return session
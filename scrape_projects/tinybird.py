@@ -1,18 +1,32 @@
+import gzip
+import json
+import time
 import uplink
 
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from loguru import logger
+from requests.exceptions import ReadTimeout
 from requests.models import Response
-from typing import Any, Dict, Optional
-from uplink import Body, Consumer, Path, Query, get, post, put, returns
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple, Union
+from uplink import Body, Consumer, Header, Path, Query, get, post, put, returns
 from uplink.auth import BearerToken
 
+from scrape_projects.connections import pooled_session
+from scrape_projects.metrics import metrics
+from scrape_projects.ratelimit import parse_retry_after
+
+# responses worth retrying, anything else is reported as a failed batch
+RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+
 
 class DatasourcesApi(Consumer):
     def __init__(self, token: str, *args, **kwargs) -> None:
+        kwargs.setdefault("client", pooled_session())
         super().__init__(
             base_url="https://api.tinybird.co/",
             auth=BearerToken(token=token),
             *args,
-            **kwargs
+            **kwargs,
         )
 
     @returns.json
@@ -31,7 +45,7 @@ class DatasourcesApi(Consumer):
         name: Query(name="name", type=str),
         mode: Query(name="mode", type=str),
         schema: Query(name="schema", type=str),
-        data: Body = {}
+        data: Body = {},
     ):
         pass
 
@@ -56,11 +70,12 @@ class DatasourcesApi(Consumer):
 
 class PipeApi(Consumer):
     def __init__(self, token: str, *args, **kwargs) -> None:
+        kwargs.setdefault("client", pooled_session())
         super().__init__(
             base_url="https://api.tinybird.co/",
             auth=BearerToken(token=token),
             *args,
-            **kwargs
+            **kwargs,
         )
 
     @post("/v0/pipes")
@@ -93,7 +108,9 @@ class PipeApi(Consumer):
         pass
 
     @put("/v0/pipes/{pipe}/endpoint")
-    def enable_node(self, pipe: uplink.Path(name="pipe", type=str), data: Body) -> Response:
+    def enable_node(
+        self, pipe: uplink.Path(name="pipe", type=str), data: Body
+    ) -> Response:
         """
         Enables a particular transformation for a pipe. This endpoint requires the
         pipe name (param: pipe) and the id of the transformation node for the pipe.
@@ -106,11 +123,12 @@ class PipeApi(Consumer):
 
 class TinyBirdApi(Consumer):
     def __init__(self, token: str, *args, **kwargs) -> None:
+        kwargs.setdefault("client", pooled_session())
         super().__init__(
             base_url="https://api.tinybird.co/",
             auth=BearerToken(token=token),
             *args,
-            **kwargs
+            **kwargs,
         )
 
     @returns.json
@@ -139,6 +157,19 @@ class TinyBirdApi(Consumer):
     ):
         pass
 
+    @post("/v0/events")
+    def append_compressed_events(
+        self,
+        name: Query(name="name", type=str),
+        wait: Query(name="wait", type=bool),
+        data: Body,
+        content_encoding: Header("Content-Encoding") = "gzip",
+    ):
+        """
+        Same as append_events but data is a gzip compressed ndjson payload
+        """
+        pass
+
     # @delete("/v0/datasources")
 
     @post("/v0/pipes")
@@ -156,17 +187,20 @@ class TinyBirdApi(Consumer):
         pass
 
     @put("/v0/pipes/{pipe}/endpoint")
-    def enable_node(self, pipe: uplink.Path(name="pipe", type=str), data: Body) -> Response:
+    def enable_node(
+        self, pipe: uplink.Path(name="pipe", type=str), data: Body
+    ) -> Response:
         pass
 
 
 class ValorantDatasourceApi(Consumer):
     def __init__(self, token: str, *args, **kwargs) -> None:
+        kwargs.setdefault("client", pooled_session())
         super().__init__(
             base_url="https://api.tinybird.co/",
             auth=BearerToken(token=token),
             *args,
-            **kwargs
+            **kwargs,
         )
 
     @returns.json
@@ -196,3 +230,200 @@ def set_active_node(
         if node["name"] == endpoint_name:
             return consumer.enable_node(pipe_name, node["id"])
     return None
+
+
+class EventsUploader:
+    """
+    Streams ndjson rows to a datasource through the events api. Rows are cut
+    into batches by size and row count, every batch is gzipped and sent on the
+    api's (pooled) session with up to max_in_flight batches in the air. Failed
+    batches are retried with exponential backoff (or after the Retry-After of a
+    throttled request), a batch that keeps failing is logged and counted
+    without affecting the others. A batch whose answer timed out is not
+    retried, as it may have been inserted, and is counted as failed.
+    """
+
+    def __init__(
+        self,
+        api: TinyBirdApi,
+        name: str,
+        max_batch_bytes: int = 8 * 1024**2,
+        max_batch_rows: int = 50_000,
+        max_in_flight: int = 4,
+        max_retries: int = 5,
+        backoff: float = 1.0,
+        wait: bool = True,
+    ) -> None:
+        self.api = api
+        self.name = name
+        self.max_batch_bytes = max_batch_bytes
+        self.max_batch_rows = max_batch_rows
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.wait = wait
+        self.summary = {
+            "batches": 0,
+            "successful_rows": 0,
+            "quarantined_rows": 0,
+            "failed_rows": 0,
+        }
+        self._batch: List[bytes] = []
+        self._batch_bytes = 0
+        self._in_flight: Set[Future] = set()
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight)
+
+    def __enter__(self) -> "EventsUploader":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def add(self, row: Union[str, Dict[str, Any]]) -> None:
+        if not isinstance(row, str):
+            row = json.dumps(row)
+        encoded = row.encode()
+
+        if self._batch and self._batch_bytes + len(encoded) > self.max_batch_bytes:
+            self.flush()
+
+        self._batch.append(encoded)
+        self._batch_bytes += len(encoded) + 1
+
+        if len(self._batch) >= self.max_batch_rows:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._batch:
+            return
+
+        while len(self._in_flight) >= self.max_in_flight:
+            done, self._in_flight = wait(self._in_flight, return_when=FIRST_COMPLETED)
+            self._collect(done)
+
+        rows = len(self._batch)
+        payload = gzip.compress(b"\n".join(self._batch))
+        self._batch, self._batch_bytes = [], 0
+        self._in_flight.add(self._executor.submit(self._send, payload, rows))
+
+    def close(self) -> Dict[str, int]:
+        self.flush()
+        self._collect(wait(self._in_flight).done)
+        self._in_flight = set()
+        self._executor.shutdown(wait=True)
+
+        logger.info(
+            f"Uploaded {self.summary['successful_rows']} rows to {self.name} "
+            f"in {self.summary['batches']} batches"
+        )
+        if self.summary["quarantined_rows"] != 0:
+            logger.warning(
+                f"{self.summary['quarantined_rows']} rows quarantined in {self.name}, see UI for details"
+            )
+        if self.summary["failed_rows"] != 0:
+            logger.error(
+                f"{self.summary['failed_rows']} rows failed to upload to {self.name}"
+            )
+        return self.summary
+
+    def upload(self, rows: Iterable[Union[str, Dict[str, Any]]]) -> Dict[str, int]:
+        for row in rows:
+            self.add(row)
+        return self.close()
+
+    def _collect(self, done: Iterable[Future]) -> None:
+        for future in done:
+            rows, result = future.result()
+            self.summary["batches"] += 1
+            if result is None:
+                self.summary["failed_rows"] += rows
+                metrics.inc(
+                    "upload_rows_total", rows, datasource=self.name, outcome="failed"
+                )
+                continue
+            for outcome in ("successful", "quarantined"):
+                count = result.get(f"{outcome}_rows", 0)
+                self.summary[f"{outcome}_rows"] += count
+                metrics.inc(
+                    "upload_rows_total", count, datasource=self.name, outcome=outcome
+                )
+
+    def _send(self, payload: bytes, rows: int) -> Tuple[int, Optional[Dict[str, Any]]]:
+        for attempt in range(self.max_retries + 1):
+            try:
+                metrics.inc("upload_bytes_total", len(payload), datasource=self.name)
+                with metrics.timer("upload_seconds", datasource=self.name):
+                    response = self.api.append_compressed_events(
+                        name=self.name, wait=self.wait, data=payload
+                    )
+            except ReadTimeout as exception:
+                # the batch was sent and may have been inserted, sending it
+                # again could insert it twice
+                logger.error(
+                    f"No answer for batch of {rows} rows to {self.name} ({exception!r}), "
+                    "not retrying as it may have been inserted"
+                )
+                return rows, None
+            except Exception as exception:
+                retry_after, reason = None, repr(exception)
+            else:
+                if response.ok:
+                    return rows, self._inserted(response, rows)
+                if response.status_code not in RETRYABLE_STATUS_CODES:
+                    logger.error(
+                        f"Batch of {rows} rows rejected by {self.name} - "
+                        f"{response.status_code} {response.text}"
+                    )
+                    return rows, None
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                reason = f"status code {response.status_code}"
+
+            if attempt == self.max_retries:
+                break
+            delay = self.backoff * 2**attempt
+            if retry_after is not None:
+                delay = max(delay, retry_after)
+            logger.warning(
+                f"Batch of {rows} rows to {self.name} failed ({reason}), retrying in {delay}s"
+            )
+            metrics.inc("upload_retries_total", datasource=self.name)
+            time.sleep(delay)
+
+        logger.error(f"Giving up on batch of {rows} rows to {self.name} ({reason})")
+        return rows, None
+
+    def _inserted(self, response: Response, rows: int) -> Dict[str, Any]:
+        """
+        Row counts of an accepted batch, the whole batch counts as successful
+        when tinybird did not wait for the insert or its answer is unreadable
+        """
+        if not self.wait:
+            return {"successful_rows": rows}
+        try:
+            return response.json()
+        except ValueError:
+            logger.warning(
+                f"Could not decode the answer to a batch of {rows} rows to {self.name}, "
+                "counting them as successful"
+            )
+            return {"successful_rows": rows}
+
+
+def upload_to_datasources(
+    api: TinyBirdApi, rows: Iterable[Tuple[str, Union[str, Dict[str, Any]]]], **options
+) -> Dict[str, Dict[str, int]]:
+    """
+    Streams (datasource name, row) pairs to their datasources, an EventsUploader
+    (built with options) is opened for every datasource on its first row.
+    Returns the upload summary of every datasource.
+    """
+    uploaders: Dict[str, EventsUploader] = {}
+    try:
+        for name, row in rows:
+            if name not in uploaders:
+                uploaders[name] = EventsUploader(api, name, **options)
+            uploaders[name].add(row)
+    finally:
+        for uploader in uploaders.values():
+            uploader.close()
+    return {name: uploader.summary for name, uploader in uploaders.items()}
@@ -1,24 +1,118 @@
+import hashlib
+import json
 import os
 import parsel
 import pendulum
 import requests
+import threading
+import time
 import uplink
 import yaml
 
+from collections import OrderedDict, deque
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from functools import lru_cache
+from lxml import etree
+from parsel.csstranslator import HTMLTranslator
+from pendulum.tz.timezone import Timezone
 from uplink.auth import ApiTokenParam
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, asdict, field
 from loguru import logger
 from pathlib import Path
-from typing import Any, Dict, List, Literal, Optional, Tuple, Union
+from typing import (
+    Any,
+    Deque,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Literal,
+    Optional,
+    Tuple,
+    Union,
+)
+from scrape_projects.cache import CachePolicy, ResponseCache, mount_cache
+from scrape_projects.connections import pooled_session
+from scrape_projects.hedging import mount_hedging
+from scrape_projects.metrics import instrument_session, metrics
+from scrape_projects.ratelimit import AdaptiveRateLimiter, mount_rate_limiter
 from scrape_projects.valorant.items import (
     ValorantResultItem,
-    try_pendulum_timestamp,
     TeamResult,
     PlayerResult,
 )
+from scrape_projects.valorant.datasources import (
+    VALORANT_MATCH_PLAYER_RESULTS,
+    VALORANT_MATCH_TEAM_RESULTS,
+)
+from scrape_projects.valorant.match_index import MatchIndex
 
 BASE_URL = "https://vlr.gg"
 
+# where resolve_timezone keeps the timezone looked up through the api
+TIMEZONE_CACHE_PATH = Path.home() / ".cache" / "scrape_projects" / "timezone.json"
+TIMEZONE_CACHE_TTL = 24 * 60 * 60
+
+# results pages change as matches finish, completed match pages don't
+VLR_CACHE_POLICIES = [
+    CachePolicy(pattern=r"^/matches/results", ttl=15 * 60),
+    CachePolicy(pattern=r"^/\d+/", ttl=None),
+]
+
+# a daemon polls to see what just finished, its results pages are always
+# revalidated
+VLR_POLL_CACHE_POLICIES = [
+    CachePolicy(pattern=r"^/matches/results", ttl=0),
+    CachePolicy(pattern=r"^/\d+/", ttl=None),
+]
+
+# without a configured cache, results pages are still kept in memory so that
+# fetching one again is a conditional request (ttl 0 = always revalidated)
+VLR_REVALIDATION_POLICIES = [CachePolicy(pattern=r"^/matches/results", ttl=0)]
+VLR_REVALIDATION_CACHE_SIZE = 64 * 1024**2
+
+# parsed results pages kept to skip parsing a page whose body did not change
+RESULTS_PAGE_MEMO_SIZE = 256
+
+
+@lru_cache(maxsize=None)
+def shared_rate_limiter() -> AdaptiveRateLimiter:
+    """
+    The limiter every vlr.gg consumer of the process shares, so concurrent
+    scrapers never add up to more than one budget. Starts at VLR_RATE_LIMIT
+    requests per second and probes up to VLR_MAX_RATE.
+    """
+    return AdaptiveRateLimiter(
+        "vlr.gg",
+        rate=float(os.environ.get("VLR_RATE_LIMIT", 2.0)),
+        max_rate=float(os.environ.get("VLR_MAX_RATE", 10.0)),
+    )
+
+
+def cache_from_env(
+    policies: List[CachePolicy] = VLR_CACHE_POLICIES,
+) -> Optional[ResponseCache]:
+    """
+    Builds the vlr.gg response cache configured through VLR_CACHE_PATH, setting
+    VLR_CACHE_REPLAY=1 re-extracts from the archived pages without any request
+    """
+    cache_path = os.environ.get("VLR_CACHE_PATH")
+    if not cache_path:
+        return None
+
+    return ResponseCache(
+        cache_path,
+        policies=policies,
+        replay_only=os.environ.get("VLR_CACHE_REPLAY") == "1",
+    )
+
+
 stats_table_map = {
     "Rating": "rating",
     "Average Combat Score": "acs",
@@ -31,13 +125,6 @@ stats_table_map = {
     "First Deaths": "first_deaths",
 }
 
-special_stats_columns = [
-    "player_id",
-    "player_name",
-    "agent",
-    "deaths",
-]
-
 leaf_queries = {
     "start_time": "./div[@class='match-item-time']",
     "status": "./div[@class='match-item-eta']/div[contains(@class, 'ml ')]/div[@class='ml-status']",
@@ -48,11 +135,234 @@ leaf_queries = {
     "map_stats": "./div[@class='match-item-vod']/div[@class='wf-tag mod-big'][1]",
 }
 
-player_stats_query = "./div/div/table/tbody/tr/td[{position}]/span/span[contains(@class, 'mod-both')]/text()"
+# same prefix -> uri mapping parsel registers for its selectors
+xpath_namespaces = {"re": "http://exslt.org/regular-expressions"}
+
+
+def compile_xpath(query: str) -> etree.XPath:
+    return etree.XPath(query, namespaces=xpath_namespaces, smart_strings=False)
+
+
+normalized_text_xpath = compile_xpath("normalize-space(./text())")
+first_normalized_text_xpath = compile_xpath("normalize-space(text()[1])")
+results_cards_xpath = compile_xpath("//div[@class='wf-card']")
+results_dates_xpath = compile_xpath("//div[@class='wf-label mod-large']")
+results_matches_xpath = compile_xpath(
+    "./a[contains(@class, 'wf-module-item match-item')]"
+)
+results_link_xpath = compile_xpath("@href")
+leaf_xpaths = {leaf: compile_xpath(query) for leaf, query in leaf_queries.items()}
+# game navigation items and game containers are collected in a single walk
+games_index_xpath = compile_xpath(
+    "//div[(contains(@class, 'vm-stats-gamesnav-item') or contains(@class, 'vm-stats-game '))"
+    " and re:test(@data-game-id, '^\\d+$')]"
+)
+
+
+def selector_roots(
+    parent: Union[parsel.Selector, parsel.SelectorList, etree._Element]
+) -> List[Any]:
+    """
+    Unwraps parsel selectors into the lxml nodes compiled xpaths run against
+    """
+    if isinstance(parent, parsel.SelectorList):
+        return [selector.root for selector in parent]
+    if isinstance(parent, parsel.Selector):
+        return [parent.root]
+    return [parent]
+
+
+def serialize_node(node: etree._Element) -> str:
+    # mirrors parsel's Selector.get for element nodes
+    return etree.tostring(node, method="html", encoding="unicode", with_tail=False)
+
+
+# the player columns read from the config selectors (their queries made
+# relative to a single row of a game's stats tables), stat columns are located
+# through the (cached) header layout
+PLAYER_ROW_PATH = "./div/div/table/tbody/tr/"
+PLAYER_ROW_ATTRIBUTES = ("player_id", "player_name", "agent", "deaths")
+player_stats_cell_query = (
+    "td[{position}]/span/span[contains(@class, 'mod-both')]/text()"
+)
+
+# one line per stats table row: table position (team) followed by the cells
+player_rows_stylesheet = """
+<xsl:stylesheet version="1.0" xmlns:xsl="http://www.w3.org/1999/XSL/Transform">
+  <xsl:output method="text"/>
+  <xsl:template match="/">
+    <xsl:for-each select="*/div/div/table">
+      <xsl:variable name="table" select="position()"/>
+      <xsl:for-each select="tbody/tr">
+        <xsl:value-of select="$table"/>{cells}<xsl:text>&#10;</xsl:text>
+      </xsl:for-each>
+    </xsl:for-each>
+  </xsl:template>
+</xsl:stylesheet>
+"""
+# cells are normalized so embedded tabs / newlines can't break the row layout
+player_rows_cell = (
+    '<xsl:text>&#9;</xsl:text><xsl:value-of select="normalize-space({query})"/>'
+)
+
+player_rows_transforms = threading.local()
+
+
+@lru_cache(maxsize=32)
+def stats_table_layout(
+    header: Tuple[str, ...], row_queries: Tuple[Tuple[str, str], ...]
+) -> Tuple[Tuple[str, str], ...]:
+    """
+    Maps a stats table header to the (attribute, query) pairs of a row, cached
+    per distinct header since every game of every match shares a handful of them
+    """
+    # enumerate starts from 2 because the first column (player) doesn't have a
+    # header and position is 1-based
+    return row_queries + tuple(
+        (stats_table_map[title], player_stats_cell_query.format(position=position))
+        for position, title in enumerate(header, start=2)
+        if title in stats_table_map
+    )
+
+
+def player_rows_transform(
+    header: Tuple[str, ...], row_queries: Tuple[Tuple[str, str], ...]
+) -> etree.XSLT:
+    """
+    Compiles (once per thread, header and row queries) the stylesheet that walks
+    every stats table row of a game and writes its cells in the layout of the
+    header
+    """
+    transforms = player_rows_transforms.__dict__.setdefault("by_layout", {})
+    if (header, row_queries) not in transforms:
+        cells = "".join(
+            player_rows_cell.format(query=query)
+            for _, query in stats_table_layout(header, row_queries)
+        )
+        transforms[header, row_queries] = etree.XSLT(
+            etree.XML(player_rows_stylesheet.format(cells=cells))
+        )
+    return transforms[header, row_queries]
+
+
+def extract_player_rows(
+    game: etree._Element,
+    header: Tuple[str, ...],
+    row_queries: Tuple[Tuple[str, str], ...],
+    team_ids: List[int],
+    columns: Tuple[str, ...],
+) -> Iterator[Tuple[Any, ...]]:
+    """
+    Walks the rows of a game's stats tables (one table per team) in a single
+    pass and yields the values of every player ordered as `columns`, cells that
+    are missing or empty come back as None. row_queries are the (attribute,
+    query) pairs of the player columns, relative to a row.
+    """
+    attributes = [attribute for attribute, _ in stats_table_layout(header, row_queries)]
+    transform = player_rows_transform(header, row_queries)
+    for line in str(transform(game)).splitlines():
+        table, *cells = line.split("\t")
+        values = {attribute: cell or None for attribute, cell in zip(attributes, cells)}
+        table_index = int(table) - 1
+        values["team_id"] = (
+            team_ids[table_index] if table_index < len(team_ids) else None
+        )
+        if values["player_id"] is not None:
+            values["player_id"] = int(values["player_id"].split("/")[2])
+
+        yield tuple(values.get(column) for column in columns)
+
+
+def index_games(root: etree._Element) -> Tuple[List[str], Dict[int, etree._Element]]:
+    """
+    Walks a match page once, returns the ids of the games with data (enabled
+    in the game navigation) and a game_id -> game container index
+    """
+    games_with_data = []
+    games = {}
+    for node in games_index_xpath(root):
+        game_id = node.get("data-game-id")
+        if "vm-stats-gamesnav-item" in node.get("class"):
+            if node.get("data-disabled") == "0":
+                games_with_data.append(game_id)
+        else:
+            games.setdefault(int(game_id), node)
+    return games_with_data, games
+
+
+def first_normalized_text(xpath: etree.XPath, root: etree._Element) -> Optional[str]:
+    nodes = xpath(root)
+    return normalized_text_xpath(nodes[0]) if nodes else None
+
+
+def parse_results_page(text: str, timezone: Timezone) -> List[ValorantResultItem]:
+    root = parsel.Selector(text=text).root
+    cards = results_cards_xpath(root)
+    dates = [normalized_text_xpath(date) for date in results_dates_xpath(root)]
+
+    matches = []
+    for date, card in zip(dates, cards):
+        for match in results_matches_xpath(card):
+            links = results_link_xpath(match)
+            matches.append(
+                ValorantResultItem(
+                    **(
+                        {
+                            "start_date": date,
+                            "link": links[0] if links else None,
+                            "current_timezone": timezone,
+                        }
+                        | {
+                            leaf: first_normalized_text(xpath, match)
+                            for leaf, xpath in leaf_xpaths.items()
+                        }
+                    )
+                )
+            )
+
+    return matches
+
+
+def create_parse_executor(parse_workers: int) -> Optional[ProcessPoolExecutor]:
+    """
+    Process pool used to take HTML parsing off the GIL, None when disabled
+    """
+    if parse_workers <= 0:
+        return None
+    logger.info(f"Starting {parse_workers} parser processes")
+    executor = ProcessPoolExecutor(
+        max_workers=parse_workers, initializer=reset_worker_metrics
+    )
+    # with the fork start method every worker is forked on the first submit,
+    # do it now rather than once the fetch threads hold the metrics and
+    # logging locks a child would inherit held
+    executor.submit(int).result()
+    return executor
+
+
+def split_match_link(link: str) -> Tuple[int, str]:
+    """
+    Splits a vlr.gg match link (i.e. /{match_id}/{match_stub}) into the
+    arguments expected by ValorantStatistics.get_match
+    """
+    split_link = link.split("/")
+    return int(split_link[1]), split_link[2]
+
+
+def match_rows(match_data: Dict[str, Any]) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Yields (datasource name, row) for the team and player rows of a scraped match
+    """
+    for game in match_data["games"]:
+        for row in game["team_results"]:
+            yield VALORANT_MATCH_TEAM_RESULTS.name, row
+        for row in game["player_results"]:
+            yield VALORANT_MATCH_PLAYER_RESULTS.name, row
 
 
 class TimezoneAPI(uplink.Consumer):
     def __init__(self, token: str, *args, **kwargs):
+        kwargs.setdefault("client", pooled_session())
         super().__init__(
             base_url="https://api.ipgeolocation.io",
             auth=ApiTokenParam(param="apiKey", token=token),
@@ -66,7 +376,30 @@ class TimezoneAPI(uplink.Consumer):
 
 
 class ValorantStatistics(uplink.Consumer):
-    def __init__(self, *args, **kwargs) -> None:
+    def __init__(
+        self,
+        cache: Optional[ResponseCache] = None,
+        rate_limiter: Optional[AdaptiveRateLimiter] = None,
+        hedge: Optional[bool] = None,
+        *args,
+        **kwargs,
+    ) -> None:
+        client = kwargs.get("client") or pooled_session()
+        prefixes = [BASE_URL, BASE_URL.replace("://", "://www.")]
+        # cache hits are answered before reaching the limiter, hedging sits
+        # below it so only the time a request spends in flight is measured,
+        # and its duplicates take a slot of the same limiter
+        rate_limiter = rate_limiter or shared_rate_limiter()
+        if hedge if hedge is not None else os.environ.get("VLR_HEDGE") == "1":
+            mount_hedging(client, prefixes, limiter=rate_limiter)
+        mount_rate_limiter(client, rate_limiter, prefixes)
+        if cache is None:
+            cache = ResponseCache(
+                policies=VLR_REVALIDATION_POLICIES,
+                max_size=VLR_REVALIDATION_CACHE_SIZE,
+            )
+        mount_cache(client, cache, prefixes=prefixes)
+        kwargs["client"] = instrument_session(client)
         super().__init__(base_url=BASE_URL, *args, **kwargs)
 
     @uplink.get("/matches/results")
@@ -82,49 +415,247 @@ class ValorantStatistics(uplink.Consumer):
         pass
 
 
+def read_cached_timezone(cache_path: Path, ttl: float) -> Optional[str]:
+    try:
+        cached = json.loads(cache_path.read_text())
+    except (OSError, ValueError):
+        return None
+    if time.time() - cached.get("resolved_at", 0) > ttl:
+        return None
+    return cached.get("timezone")
+
+
+def resolve_timezone(
+    timezone: Optional[str] = None,
+    cache_path: Optional[Path] = None,
+    ttl: float = TIMEZONE_CACHE_TTL,
+) -> Timezone:
+    """
+    vlr.gg shows match times in the timezone of the scraping machine, which is
+    taken from (in order) timezone, VLR_TIMEZONE, the cache file written by a
+    previous lookup if younger than ttl seconds and last the ipgeolocation api
+    """
+    timezone = timezone or os.environ.get("VLR_TIMEZONE")
+    if timezone:
+        return pendulum.timezone(timezone)
+
+    cache_path = cache_path or Path(
+        os.environ.get("VLR_TIMEZONE_CACHE", TIMEZONE_CACHE_PATH)
+    )
+    timezone = read_cached_timezone(cache_path, ttl)
+    if timezone:
+        return pendulum.timezone(timezone)
+
+    tz_consumer = TimezoneAPI(token=os.environ.get("IPGEO_API_KEY"))
+    timezone = tz_consumer.get_timezone().json()["timezone"]
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        cache_path.write_text(
+            json.dumps({"timezone": timezone, "resolved_at": time.time()})
+        )
+    except OSError as exception:
+        logger.warning(f"Could not cache timezone in {cache_path} - {exception!r}")
+    return pendulum.timezone(timezone)
+
+
 class ValorantResults:
-    def __init__(self, consumer: uplink.Consumer = ValorantStatistics()) -> None:
-        self.consumer = consumer
-        tz_consumer = TimezoneAPI(token=os.environ.get("IPGEO_API_KEY"))
-        self.timezone = pendulum.timezone(tz_consumer.get_timezone().json()["timezone"])
-        logger.info(f"Using timezone - {self.timezone}")
+    def __init__(
+        self,
+        consumer: Optional[uplink.Consumer] = None,
+        parse_workers: int = 0,
+        timezone: Optional[str] = None,
+    ) -> None:
+        self._consumer = consumer
+        self._timezone = pendulum.timezone(timezone) if timezone else None
+        self._lock = threading.Lock()
+        self.parse_executor = create_parse_executor(parse_workers)
+        self.pages_walked: List[int] = []
+        # page -> (body hash, matches parsed from that body)
+        self.parsed_pages: OrderedDict[
+            int, Tuple[str, List[ValorantResultItem]]
+        ] = OrderedDict()
+
+    @property
+    def consumer(self) -> uplink.Consumer:
+        # built on first request, parsing alone (e.g. in worker processes) never needs it
+        with self._lock:
+            if self._consumer is None:
+                self._consumer = ValorantStatistics()
+        return self._consumer
+
+    @property
+    def timezone(self) -> Timezone:
+        # resolved on first use so that building the scraper does no request
+        with self._lock:
+            if self._timezone is None:
+                self._timezone = resolve_timezone()
+                logger.info(f"Using timezone - {self._timezone}")
+        return self._timezone
+
+    def close(self) -> None:
+        if self.parse_executor is not None:
+            self.parse_executor.shutdown(wait=True, cancel_futures=True)
 
     def scrape_results_page(self, page: int) -> List[ValorantResultItem]:
+        return self.fetch_and_parse_results_page(page)
+
+    def parse_results_page(self, text: str) -> List[ValorantResultItem]:
+        with metrics.timer("parse_seconds", page="results"):
+            return parse_results_page(text, self.timezone)
+
+    def reuse_results_page(
+        self, page: int, body: bytes
+    ) -> Tuple[str, Optional[List[ValorantResultItem]]]:
+        """
+        Returns the hash of a results page body along with the matches parsed
+        from the same body last time the page was fetched (None if it changed),
+        revalidated (304) pages always come back with the same body
+        """
+        body_hash = hashlib.sha256(body).hexdigest()
+        with self._lock:
+            known_hash, matches = self.parsed_pages.get(page, (None, None))
+            if known_hash != body_hash:
+                return body_hash, None
+            self.parsed_pages.move_to_end(page)
+        metrics.inc("parse_skipped_total", page="results")
+        return body_hash, list(matches)
+
+    def remember_results_page(
+        self, page: int, body_hash: str, matches: List[ValorantResultItem]
+    ) -> None:
+        with self._lock:
+            self.parsed_pages[page] = (body_hash, list(matches))
+            self.parsed_pages.move_to_end(page)
+            while len(self.parsed_pages) > RESULTS_PAGE_MEMO_SIZE:
+                self.parsed_pages.popitem(last=False)
+
+    def fetch_and_parse_results_page(self, page: int) -> List[ValorantResultItem]:
+        """
+        Fetches a results page and parses it (in a parse worker when there are
+        any), unless its body is the one the remembered matches came from
+        """
         response = self.consumer.get_results(page=page)
-        main_selector = parsel.Selector(text=response.text)
-        cards = main_selector.xpath("//div[@class='wf-card']")
-        dates = (
-            main_selector.xpath("//div[@class='wf-label mod-large']")
-            .xpath("normalize-space(./text())")
-            .getall()
-        )
+        body_hash, matches = self.reuse_results_page(page, response.content)
+        if matches is not None:
+            return matches
+        if self.parse_executor is None:
+            matches = self.parse_results_page(response.text)
+        else:
+            matches, worker_metrics = self.parse_executor.submit(
+                parse_results_page_worker, self.timezone.name, response.text
+            ).result()
+            metrics.merge(worker_metrics)
+        self.remember_results_page(page, body_hash, matches)
+        return matches
+
+    def iter_results_pages(
+        self,
+        start_page: int = 1,
+        prefetch: int = 0,
+        known_pages: Optional[Dict[int, List[ValorantResultItem]]] = None,
+    ) -> Iterator[Tuple[int, List[ValorantResultItem]]]:
+        """
+        Yields (page, matches) for consecutive results pages starting at
+        start_page until an empty page is reached. With prefetch > 0 the next
+        `prefetch` pages are already being fetched while the current one is
+        parsed, pages still in flight when the iterator is closed are cancelled.
+        Pages found in known_pages are reused instead of being fetched again.
+        """
+        known_pages = known_pages or {}
 
-        matches = []
-        for date, card in zip(dates, cards):
-            for match in card.xpath(
-                "./a[contains(@class, 'wf-module-item match-item')]"
-            ):
-                matches.append(
-                    ValorantResultItem(
-                        **(
-                            {
-                                "start_date": date,
-                                "link": match.xpath("@href").get(),
-                                "current_timezone": self.timezone,
-                            }
-                            | {
-                                leaf: match.xpath(query)
-                                .xpath("normalize-space(./text())")
-                                .get()
-                                for leaf, query in leaf_queries.items()
-                            }
+        if prefetch <= 0:
+            page = start_page
+            while True:
+                if page in known_pages:
+                    matches = known_pages[page]
+                else:
+                    logger.info(
+                        f"Scraping page: {BASE_URL}/matches/results?page={page}"
+                    )
+                    matches = self.scrape_results_page(page)
+                if not matches:
+                    return
+                yield page, matches
+                page += 1
+
+        executor = ThreadPoolExecutor(max_workers=prefetch)
+        in_flight: Deque[Tuple[int, Optional[Future]]] = deque()
+        next_page = start_page
+        try:
+            while True:
+                while len(in_flight) <= prefetch:
+                    future = None
+                    if next_page not in known_pages:
+                        future = executor.submit(
+                            self.fetch_and_parse_results_page, next_page
                         )
+                    in_flight.append((next_page, future))
+                    next_page += 1
+
+                page, future = in_flight.popleft()
+                if future is None:
+                    matches = known_pages[page]
+                else:
+                    logger.info(
+                        f"Scraping page: {BASE_URL}/matches/results?page={page}"
                     )
-                )
+                    matches = future.result()
+                if not matches:
+                    return
+                yield page, matches
+        finally:
+            cancelled = sum(
+                future.cancel() for _, future in in_flight if future is not None
+            )
+            if cancelled:
+                logger.info(f"Cancelled {cancelled} prefetched results pages")
+            executor.shutdown(wait=False, cancel_futures=True)
 
-        return matches
+    def find_start_page(
+        self, end_interval: pendulum.DateTime
+    ) -> Tuple[int, Dict[int, List[ValorantResultItem]]]:
+        """
+        Finds the first results page holding matches older than end_interval by
+        galloping over the pages (1, 2, 4, 8, ...) and bisecting the last jump,
+        results pages are ordered from newest to oldest. Returns the page along
+        with every page fetched during the search so they are not fetched twice.
+        """
+        fetched: Dict[int, List[ValorantResultItem]] = {}
 
-    def get_matches_from_last_day(self):
+        def compare(page: int) -> int:
+            # -1 = page is entirely newer than end_interval, 0 = page straddles
+            # end_interval, 1 = page starts before end_interval (or is empty)
+            logger.info(f"Searching page: {BASE_URL}/matches/results?page={page}")
+            fetched[page] = self.scrape_results_page(page)
+            if not fetched[page]:
+                return 1
+            if self.get_match_timestamp(fetched[page][-1]) >= end_interval:
+                return -1
+            if self.get_match_timestamp(fetched[page][0]) >= end_interval:
+                return 0
+            return 1
+
+        low, high = 0, 1
+        while (position := compare(high)) < 0:
+            low, high = high, high * 2
+
+        while position != 0 and high - low > 1:
+            middle = (low + high) // 2
+            position = compare(middle)
+            if position < 0:
+                low = middle
+            else:
+                high = middle
+
+        logger.info(f"Found start page {high} after fetching {len(fetched)} pages")
+        return high, fetched
+
+    def get_match_timestamp(self, match: ValorantResultItem) -> pendulum.DateTime:
+        return match.start_timestamp
+
+    def iter_matches_from_last_day(
+        self, prefetch: int = 0
+    ) -> Iterator[ValorantResultItem]:
         utc_to_actual_tz_now = (
             pendulum.now("UTC")
             .start_of("day")
@@ -133,53 +664,150 @@ class ValorantResults:
             .isoformat()
         )
 
-        return self.get_matches_in_timeframe(utc_to_actual_tz_now)
+        return self.iter_matches_in_timeframe(utc_to_actual_tz_now, prefetch=prefetch)
+
+    def get_matches_from_last_day(self, prefetch: int = 0) -> List[ValorantResultItem]:
+        return list(self.iter_matches_from_last_day(prefetch=prefetch))
 
     def get_matches_in_timeframe(
-        self, timestamp_isoformat: str
+        self,
+        timestamp_isoformat: str,
+        prefetch: int = 0,
+        search: bool = False,
+        start_page: int = 1,
     ) -> List[ValorantResultItem]:
+        """
+        Returns the matches played in the day before timestamp_isoformat, see
+        iter_matches_in_timeframe
+        """
+        return list(
+            self.iter_matches_in_timeframe(
+                timestamp_isoformat,
+                prefetch=prefetch,
+                search=search,
+                start_page=start_page,
+            )
+        )
+
+    def iter_matches_in_timeframe(
+        self,
+        timestamp_isoformat: str,
+        prefetch: int = 0,
+        search: bool = False,
+        start_page: int = 1,
+    ) -> Iterator[ValorantResultItem]:
+        """
+        Yields the matches played in the day before timestamp_isoformat as each
+        results page is parsed. The walk starts at start_page (or at the page
+        found by find_start_page when search is set), the pages it went through
+        are kept in pages_walked.
+        """
         end_interval = pendulum.parse(timestamp_isoformat)
         start_interval = end_interval.subtract(days=1)
         logger.info(
             f"Scraping results between {end_interval.isoformat()} and {start_interval.isoformat()}"
         )
         interval_started = False
-        interval_completed = False
-        next_page = 1
-        matches_in_range = []
+        matches_in_range = 0
+        self.pages_walked = []
 
-        while not (interval_completed):
-            logger.info(
-                f"Scraping page: https://vlr.gg/matches/results?page={next_page}"
-            )
-            matches = self.scrape_results_page(next_page)
-            timestamps = [
-                pendulum.parse(
-                    try_pendulum_timestamp(
-                        f"{match.start_date} {match.start_time}",
-                        "ddd, MMMM DD, YYYY hh:mm A",
-                        timezone=self.timezone,
-                    )
-                )
-                for match in matches
-            ]
+        known_pages = {}
+        if search:
+            start_page, known_pages = self.find_start_page(end_interval)
 
-            matches_in_range += [
-                match
-                for timestamp, match in zip(timestamps, matches)
-                if timestamp >= start_interval and timestamp < end_interval
-            ]
+        pages = self.iter_results_pages(
+            start_page=start_page, prefetch=prefetch, known_pages=known_pages
+        )
+        try:
+            for page, matches in pages:
+                self.pages_walked.append(page)
+                timestamps = [self.get_match_timestamp(match) for match in matches]
+
+                for timestamp, match in zip(timestamps, matches):
+                    if timestamp >= start_interval and timestamp < end_interval:
+                        matches_in_range += 1
+                        yield match
+
+                if not (interval_started):
+                    interval_started = matches_in_range != 0
+
+                if interval_started and (timestamps[-1] < start_interval):
+                    break
+
+                # the whole page is older than the interval, nothing was played
+                if timestamps[0] < start_interval:
+                    break
+        finally:
+            pages.close()
+
+        logger.info(f"Scraped {matches_in_range} matches")
+
+    def iter_days_in_range(
+        self,
+        start: pendulum.Date,
+        end: pendulum.Date,
+        prefetch: int = 0,
+        search: bool = False,
+        start_page: int = 1,
+        timezone: str = "UTC",
+    ) -> Iterator[Tuple[pendulum.Date, List[ValorantResultItem]]]:
+        """
+        Walks the results pages once, from the end day (included) back to the
+        start day, and yields (day, matches) for every day of the range, newest
+        first, as soon as the walk went past the day. Days are cut in timezone,
+        a day without matches is yielded with an empty list. pages_walked holds
+        the pages that spanned the day last yielded.
+        """
+        first_day = pendulum.datetime(start.year, start.month, start.day, tz=timezone)
+        end_interval = pendulum.datetime(end.year, end.month, end.day, tz=timezone).add(
+            days=1
+        )
+        logger.info(
+            f"Scraping results between {end_interval.isoformat()} and {first_day.isoformat()}"
+        )
 
-            if not (interval_started):
-                interval_started = len(matches_in_range) != 0
+        day = end_interval.subtract(days=1)
+        day_matches: List[ValorantResultItem] = []
+        day_pages: List[int] = []
 
-            interval_completed = interval_started and (timestamps[-1] < start_interval)
+        def complete_day() -> Tuple[pendulum.Date, List[ValorantResultItem]]:
+            nonlocal day, day_matches, day_pages
+            completed = (day.date(), day_matches)
+            logger.info(
+                f"Scraped {len(day_matches)} matches for {day.to_date_string()}"
+            )
+            self.pages_walked = day_pages
+            # the page holding the boundary also starts the previous day
+            day, day_matches, day_pages = day.subtract(days=1), [], day_pages[-1:]
+            return completed
 
-            next_page += 1
+        known_pages = {}
+        if search:
+            start_page, known_pages = self.find_start_page(end_interval)
 
-        logger.info(f"Scraped {len(matches_in_range)} matches")
+        pages = self.iter_results_pages(
+            start_page=start_page, prefetch=prefetch, known_pages=known_pages
+        )
+        try:
+            for page, matches in pages:
+                day_pages.append(page)
+                for match in matches:
+                    timestamp = self.get_match_timestamp(match)
+                    if timestamp >= end_interval:
+                        continue
+                    while timestamp < day and day >= first_day:
+                        yield complete_day()
+                    if day < first_day:
+                        break
+                    day_matches.append(match)
+                if day < first_day:
+                    break
+        finally:
+            pages.close()
 
-        return matches_in_range
+        # the results ran out before the start of the range
+        while day >= first_day:
+            yield complete_day()
 
 
 class ValorantMatches:
@@ -211,33 +839,65 @@ class ValorantMatches:
     def __init__(
         self,
         config_path: Path = Path(__file__).parent / "configs" / "vlr-gg-matches.yml",
-        consumer: uplink.Consumer = ValorantStatistics(),
+        consumer: Optional[uplink.Consumer] = None,
+        parse_workers: int = 0,
+        match_index: Optional[MatchIndex] = None,
     ) -> None:
+        self.config_path = config_path
         self.config = ScrapeConfig(config_path=config_path)
-        self.consumer: ValorantStatistics = consumer
+        self._consumer = consumer
+        self._lock = threading.Lock()
+        self.parse_workers = parse_workers
+        self.match_index = match_index
+        self.parse_executor = create_parse_executor(parse_workers)
         self.leaf_selectors = {
             attribute: selector
             for attribute, selector in self.config.selector_configs.items()
             if selector.children is None
         }
         self.selectors: Dict[str, SelectorConfig] = self.config.selector_configs
+        self.player_row_queries = tuple(
+            (attribute, self.selectors[attribute].row_query(PLAYER_ROW_PATH))
+            for attribute in PLAYER_ROW_ATTRIBUTES
+        )
+
+    @property
+    def consumer(self) -> uplink.Consumer:
+        # built on first request, parsing alone (e.g. in worker processes) never needs it
+        with self._lock:
+            if self._consumer is None:
+                self._consumer = ValorantStatistics()
+        return self._consumer
+
+    def close(self) -> None:
+        if self.parse_executor is not None:
+            self.parse_executor.shutdown(wait=True, cancel_futures=True)
+
+    def fetch_match_page(self, match_id: int, match_stub: str) -> str:
+        return self.consumer.get_match(match_id=match_id, match_stub=match_stub).text
 
     def scrape_match_page(self, match_id: int, match_stub: str):
-        response = self.consumer.get_match(match_id=match_id, match_stub=match_stub)
-        main_selector = parsel.Selector(response.text)
+        text = self.fetch_match_page(match_id, match_stub)
+        with metrics.timer("parse_seconds", page="match"):
+            return self.parse_match_page(match_id, text)
+
+    def parse_match_page(self, match_id: int, text: str) -> Dict[str, Any]:
+        main_selector = parsel.Selector(text)
+
+        games_with_data, games = index_games(main_selector.root)
 
         match_data = {"match_id": match_id} | {
             x: y.get(main_selector, process_text=True)
+            if x != "games_with_data"
+            else games_with_data
             for x, y in self.leaf_selectors.items()
             if y.parent is None and y.children is None
         }
 
-        match_data["patch"] = (
-            self.leaf_selectors["patch"]
-            .get(main_selector)
-            .xpath("normalize-space(text()[1])")
-            .getall()
-        )
+        match_data["patch"] = [
+            first_normalized_text_xpath(node)
+            for node in self.leaf_selectors["patch"].evaluate(main_selector)
+        ]
 
         if len(match_data["patch_old"]) != 0:
             match_data["patch"] = match_data["patch_old"]
@@ -252,51 +912,154 @@ class ValorantMatches:
 
         team_ids = [int(x.split("/")[2]) for x in match_data["team_id"]]
 
-        game_ids = [
-            int(x)
-            for x in self.selectors["games_with_data"].get(main_selector).getall()
-        ]
+        game_ids = [int(x) for x in games_with_data]
 
         if not game_ids:
             # could be match with only one game
-            game_ids.append(
-                main_selector.xpath(
-                    "//div[contains(@class, 'vm-stats-game ') and re:test(@data-game-id, '^\\d+$')]/@data-game-id"
-                ).get()
-            )
+            game_ids += list(games)[:1]
 
-        match_data["games"] = [
-            self.scrape_data_from_game(
-                main_selector, match_id, game_id, team_ids, patch
+        match_data["games"] = []
+        for game_id in game_ids:
+            if game_id not in games:
+                logger.warning(f"No stats found for game {game_id} of match {match_id}")
+                continue
+            match_data["games"].append(
+                self.scrape_data_from_game(
+                    games[game_id], match_id, game_id, team_ids, patch
+                )
             )
-            for game_id in game_ids
-        ]
 
         return match_data
 
+    def scrape_match_pages(
+        self, links: Iterable[str], concurrency: int = 8
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Scrapes match pages concurrently using at most `concurrency` requests in
+        flight. Results are yielded in the order they finish, a match that fails
+        is logged and skipped so it does not hold up the rest of the batch.
+
+        With parse workers the fetch threads only download the pages and hand
+        the raw HTML to the parser processes, at most two pages per parser are
+        kept waiting so memory stays bounded when parsing is the bottleneck.
+
+        Matches already in the match index are skipped without being fetched.
+        """
+        links = iter(links)
+        fetching: Dict[Future, Tuple[str, int]] = {}
+        parsing: Dict[Future, str] = {}
+        max_parsing = 2 * self.parse_workers
+
+        def submit_next(executor: ThreadPoolExecutor) -> bool:
+            if self.parse_executor is not None and len(parsing) >= max_parsing:
+                return False
+            for link in links:
+                try:
+                    match_id, match_stub = split_match_link(link)
+                except (AttributeError, IndexError, ValueError) as exception:
+                    logger.error(f"Invalid match link {link!r} - {exception!r}")
+                    metrics.inc("scrape_failures_total", page="match")
+                    continue
+                if self.match_index is None or match_id not in self.match_index:
+                    break
+                logger.info(f"Skipping indexed match: {link}")
+            else:
+                return False
+            if self.parse_executor is None:
+                future = executor.submit(self.scrape_match_page, match_id, match_stub)
+            else:
+                future = executor.submit(self.fetch_match_page, match_id, match_stub)
+            fetching[future] = (link, match_id)
+            return True
+
+        executor = ThreadPoolExecutor(max_workers=concurrency)
+        try:
+            while len(fetching) < concurrency and submit_next(executor):
+                pass
+
+            while fetching or parsing:
+                done, _ = wait(
+                    list(fetching) + list(parsing), return_when=FIRST_COMPLETED
+                )
+                for future in done:
+                    if future in fetching:
+                        link, match_id = fetching.pop(future)
+                    else:
+                        link, match_id = parsing.pop(future), None
+
+                    try:
+                        result = future.result()
+                    except Exception as exception:
+                        logger.error(f"Failed to scrape {link} - {exception!r}")
+                        metrics.inc("scrape_failures_total", page="match")
+                        continue
+
+                    if match_id is None:
+                        result, worker_metrics = result
+                        metrics.merge(worker_metrics)
+                    elif self.parse_executor is not None:
+                        parsing[
+                            self.parse_executor.submit(
+                                parse_match_page_worker,
+                                str(self.config_path),
+                                match_id,
+                                result,
+                            )
+                        ] = link
+                        continue
+
+                    logger.info(f"Scraped: {link}")
+                    yield result
+
+                while len(fetching) < concurrency and submit_next(executor):
+                    pass
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+            for future in parsing:
+                future.cancel()
+
+    def iter_match_rows(
+        self, links: Iterable[str], concurrency: int = 8
+    ) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Yields (datasource name, row) for the team and player rows of every
+        match as soon as the match is scraped, see scrape_match_pages
+        """
+        for match_data in self.scrape_match_pages(links, concurrency=concurrency):
+            yield from match_rows(match_data)
+
+    def scrape_match_pages_columnar(
+        self,
+        links: Iterable[str],
+        concurrency: int = 8,
+        directory: Optional[Path] = None,
+        batch_rows: int = 64 * 1024,
+    ) -> Dict[str, Any]:
+        """
+        Same as scrape_match_pages but the team and player rows are gathered in
+        typed arrow batches (needs pyarrow). Returns a table per datasource name
+        or writes {directory}/{datasource name}.parquet when directory is set.
+        """
+        # imported here, loading pyarrow is only worth it for columnar output
+        from scrape_projects.valorant.columnar import MatchResultBatches
+
+        batches = MatchResultBatches(batch_rows=batch_rows, directory=directory)
+        for match_data in self.scrape_match_pages(links, concurrency=concurrency):
+            batches.add_match(match_data)
+        return batches.close()
+
     def scrape_data_from_game(
         self,
-        parent_selector: parsel.Selector,
+        game_selector: etree._Element,
         match_id: int,
         game_id: int,
         team_ids: Tuple[int, int],
         patch: float,
     ):
-        game_selector = parent_selector.xpath(
-            f"//div[contains(@class, 'vm-stats-game ') and @data-game-id = '{game_id}']"
+        box_score_header = tuple(
+            self.selectors["stats_table_header"].get(game_selector, process_text=True)
         )
 
-        box_score_header = self.selectors["stats_table_header"].get(
-            game_selector, process_text=True
-        )
-        # enumerate starts from 2 because the first column (player) doesn't have a header
-        # and position is 1-based
-        positions = {
-            stats_table_map.get(y): x
-            for (x, y) in enumerate(box_score_header, start=2)
-            if stats_table_map.get(y) is not None
-        }
-
         teams_selector = self.selectors["teams"].get(game_selector)
         teams_data = {
             attribute: selector.get(teams_selector, process_text=True)
@@ -304,41 +1067,42 @@ class ValorantMatches:
             if selector.parent == "teams"
         }
 
-        team_results = [
-            TeamResult(match_id, patch, game_id, team_id, *data)
-            for team_id, data in zip(
-                team_ids, zip(*[teams_data[x] for x in self.team_result_order])
+        rows = list(
+            extract_player_rows(
+                game_selector,
+                box_score_header,
+                self.player_row_queries,
+                team_ids,
+                self.player_result_order,
             )
-        ]
-
-        players_data = {
-            attribute: game_selector.xpath(
-                player_stats_query.format(position=positions.get(attribute))
-            ).getall()
-            for attribute in self.leaf_selectors
-            if positions.get(attribute) is not None
-        }
-
-        players_data |= {
-            attribute: self.leaf_selectors[attribute].get(
-                game_selector, process_text=True
-            )
-            for attribute in special_stats_columns
-        }
+        )
 
-        players_data["team_id"] = [team_ids[0]] * 5 + [team_ids[1]] * 5
-        players_data["player_id"] = [
-            int(player_id.split("/")[2]) for player_id in players_data["player_id"]
-        ]
+        with metrics.timer("export_seconds", item="team"):
+            team_results = [
+                TeamResult(match_id, patch, game_id, team_id, *data).export
+                for team_id, data in zip(
+                    team_ids, zip(*[teams_data[x] for x in self.team_result_order])
+                )
+            ]
+        metrics.inc("export_rows_total", len(team_results), item="team")
 
-        player_results = [
-            PlayerResult(match_id, game_id, *data)
-            for data in zip(*[players_data[x] for x in self.player_result_order])
-        ]
+        player_results = []
+        with metrics.timer("export_seconds", item="player"):
+            for row in rows:
+                try:
+                    player_results.append(
+                        PlayerResult(match_id, game_id, *row).export()
+                    )
+                except (TypeError, ValueError) as exception:
+                    logger.warning(
+                        f"Skipping incomplete stats row {row} of game {game_id} - {exception!r}"
+                    )
+                    metrics.inc("export_skipped_rows_total", item="player")
+        metrics.inc("export_rows_total", len(player_results), item="player")
 
         return {
-            "team_results": [x.export for x in team_results],
-            "player_results": [x.export() for x in player_results],
+            "team_results": team_results,
+            "player_results": player_results,
         }
 
 
@@ -351,25 +1115,65 @@ class SelectorConfig:
     count: Optional[int] = None
     parent: Optional[str] = None
     children: Optional[List[str]] = None
+    compiled: etree.XPath = field(init=False, repr=False, compare=False)
+    compiled_text: Optional[etree.XPath] = field(init=False, repr=False, compare=False)
 
-    def get(
-        self,
-        parent: Union[parsel.Selector, parsel.SelectorList],
-        process_text: bool = False,
-    ) -> List[str]:
-        selector = getattr(parent, self.query_type)(self.query)
-        if not process_text:
-            return selector
+    def __post_init__(self) -> None:
+        # compile once at load time, raw text extraction is folded into the
+        # expression itself, normalize-space can only run per node in XPath 1.0
+        query = self.query
+        if self.query_type == "css":
+            query = HTMLTranslator().css_to_xpath(query)
 
+        self.compiled = compile_xpath(query)
         match self.text_processing:
             case "raw":
-                return selector.xpath("./text()").getall()
-            case "normalized":
-                return selector.xpath("normalize-space(./text())").getall()
+                self.compiled_text = compile_xpath(f"({query})/text()")
             case "direct":
-                return selector.getall()
+                self.compiled_text = self.compiled
             case other:
-                return selector
+                self.compiled_text = None
+
+    def evaluate(
+        self, parent: Union[parsel.Selector, parsel.SelectorList, etree._Element]
+    ) -> List[Any]:
+        return [node for root in selector_roots(parent) for node in self.compiled(root)]
+
+    def get(
+        self,
+        parent: Union[parsel.Selector, parsel.SelectorList, etree._Element],
+        process_text: bool = False,
+    ) -> List[str]:
+        if not process_text or self.text_processing not in (
+            "raw",
+            "normalized",
+            "direct",
+        ):
+            return parsel.SelectorList(
+                parsel.Selector(root=node, type="html")
+                for node in self.evaluate(parent)
+            )
+
+        if self.text_processing == "normalized":
+            return [normalized_text_xpath(node) for node in self.evaluate(parent)]
+
+        return [
+            node if isinstance(node, str) else serialize_node(node)
+            for root in selector_roots(parent)
+            for node in self.compiled_text(root)
+        ]
+
+    def row_query(self, row_path: str) -> str:
+        """
+        The query of this selector relative to one of the rows it walks, e.g.
+        a stats table cell, for queries starting with row_path
+        """
+        if self.query_type != "xpath" or not self.query.startswith(row_path):
+            raise ValueError(
+                f"{self.attribute} selector does not start with {row_path}: {self.query!r}"
+            )
+        query = self.query[len(row_path) :]
+        return query if self.text_processing == "direct" else f"{query}/text()"
 
     def validate(self, result: List[str]) -> bool:
         if not self.count:
@@ -392,3 +1196,31 @@ class ScrapeConfig:
             selector["attribute"]: SelectorConfig(**selector)
             for selector in parsed_yaml["selectors"]
         }
+
+
+def reset_worker_metrics() -> None:
+    # forked workers inherit the parent's series, they must only report their own
+    metrics.reset_after_fork()
+
+
+@lru_cache(maxsize=None)
+def match_page_parser(config_path: str) -> ValorantMatches:
+    # built once per parser process, parsing never touches the consumer
+    return ValorantMatches(config_path=Path(config_path))
+
+
+def parse_match_page_worker(
+    config_path: str, match_id: int, text: str
+) -> Tuple[Dict[str, Any], Tuple[Dict, Dict]]:
+    # the metrics recorded in the worker travel back with the result
+    with metrics.timer("parse_seconds", page="match"):
+        match_data = match_page_parser(config_path).parse_match_page(match_id, text)
+    return match_data, metrics.drain()
+
+
+def parse_results_page_worker(
+    timezone_name: str, text: str
+) -> Tuple[List[ValorantResultItem], Tuple[Dict, Dict]]:
+    with metrics.timer("parse_seconds", page="results"):
+        matches = parse_results_page(text, pendulum.timezone(timezone_name))
+    return matches, metrics.drain()
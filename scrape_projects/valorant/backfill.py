@@ -0,0 +1,263 @@
+import json
+import pendulum
+import sqlite3
+
+from loguru import logger
+from pathlib import Path
+from typing import Dict, Iterator, List, Union
+
+from scrape_projects.tinybird import EventsUploader, TinyBirdApi
+from scrape_projects.valorant import (
+    ValorantMatches,
+    ValorantResults,
+    split_match_link,
+)
+from scrape_projects.valorant.datasources import (
+    VALORANT_MATCH_PLAYER_RESULTS,
+    VALORANT_MATCH_TEAM_RESULTS,
+    VALORANT_RESULTS_DATASOURCE,
+)
+
+
+class BackfillCheckpoint:
+    """
+    Local sqlite record of a backfill: the results pages walked and matches
+    found for every day, whether the day's results were uploaded and which
+    match ids were scraped and uploaded (with their row counts)
+    """
+
+    def __init__(self, path: Union[str, Path]) -> None:
+        self.path = path
+        self._connection = sqlite3.connect(str(path))
+        with self._connection:
+            self._connection.executescript(
+                """
+                create table if not exists days (
+                    day text primary key,
+                    pages_walked text,
+                    results_uploaded integer default 0
+                );
+                create table if not exists results (
+                    day text,
+                    link text,
+                    item text,
+                    primary key (day, link)
+                );
+                create table if not exists matches (
+                    match_id integer primary key,
+                    day text,
+                    team_rows integer,
+                    player_rows integer
+                );
+                """
+            )
+
+    def day_walked(self, day: str) -> bool:
+        return (
+            self._connection.execute(
+                "select 1 from days where day = ?", (day,)
+            ).fetchone()
+            is not None
+        )
+
+    def record_day(self, day: str, pages_walked: List[int], items: List[str]) -> None:
+        with self._connection:
+            self._connection.executemany(
+                "insert or replace into results values (?, ?, ?)",
+                [(day, json.loads(item)["link"], item) for item in items],
+            )
+            self._connection.execute(
+                "insert or replace into days (day, pages_walked) values (?, ?)",
+                (day, json.dumps(pages_walked)),
+            )
+
+    def pages_walked(self, day: str) -> List[int]:
+        row = self._connection.execute(
+            "select pages_walked from days where day = ?", (day,)
+        ).fetchone()
+        return json.loads(row[0]) if row else []
+
+    def results(self, day: str) -> List[str]:
+        return [
+            item
+            for (item,) in self._connection.execute(
+                "select item from results where day = ?", (day,)
+            )
+        ]
+
+    def results_uploaded(self, day: str) -> bool:
+        row = self._connection.execute(
+            "select results_uploaded from days where day = ?", (day,)
+        ).fetchone()
+        return bool(row and row[0])
+
+    def mark_results_uploaded(self, day: str) -> None:
+        with self._connection:
+            self._connection.execute(
+                "update days set results_uploaded = 1 where day = ?", (day,)
+            )
+
+    def pending_links(self, day: str) -> List[str]:
+        """
+        Links of the day's matches with map and player stats not yet uploaded
+        """
+        done = {
+            match_id
+            for (match_id,) in self._connection.execute(
+                "select match_id from matches where day = ?", (day,)
+            )
+        }
+        links = []
+        for item in map(json.loads, self.results(day)):
+            if not (item["map_stats"] and item["player_stats"]):
+                continue
+            if split_match_link(item["link"])[0] not in done:
+                links.append(item["link"])
+        return links
+
+    def record_matches(self, day: str, row_counts: Dict[int, Dict[str, int]]) -> None:
+        with self._connection:
+            self._connection.executemany(
+                "insert or replace into matches values (?, ?, ?, ?)",
+                [
+                    (match_id, day, counts["team_rows"], counts["player_rows"])
+                    for match_id, counts in row_counts.items()
+                ],
+            )
+
+    def close(self) -> None:
+        self._connection.close()
+
+
+def iter_days(start: pendulum.Date, end: pendulum.Date) -> Iterator[pendulum.Date]:
+    """
+    Days from end back to start (both included), newest first like the
+    results pages so consecutive days continue from the same pages
+    """
+    day = end
+    while day >= start:
+        yield day
+        day = day.subtract(days=1)
+
+
+class BackfillRunner:
+    """
+    Scrapes and uploads results, team and player rows for every (UTC) day of
+    a date range. Progress goes to a BackfillCheckpoint after each step, so a
+    run that is interrupted resumes where it stopped: walked days are not
+    walked again, uploaded results are not uploaded again and scraped matches
+    are skipped. Matches are uploaded in groups of matches_per_checkpoint, a
+    crash between an upload and its checkpoint repeats at most one group.
+    """
+
+    def __init__(
+        self,
+        results_scraper: ValorantResults,
+        matches_scraper: ValorantMatches,
+        tinybird: TinyBirdApi,
+        checkpoint: BackfillCheckpoint,
+        concurrency: int = 8,
+        prefetch: int = 2,
+        matches_per_checkpoint: int = 25,
+    ) -> None:
+        self.results_scraper = results_scraper
+        self.matches_scraper = matches_scraper
+        self.tinybird = tinybird
+        self.checkpoint = checkpoint
+        self.concurrency = concurrency
+        self.prefetch = prefetch
+        self.matches_per_checkpoint = matches_per_checkpoint
+
+    def run(self, start: pendulum.Date, end: pendulum.Date) -> None:
+        """
+        Uploads the days walked by an earlier run, then walks the results pages
+        once over the days left and uploads every day as soon as it is complete
+        """
+        start_page = 1
+        pending = []
+        for day in iter_days(start, end):
+            key = day.to_date_string()
+            if not self.checkpoint.day_walked(key):
+                pending.append(day)
+                continue
+            if not pending:
+                # the last page of the newest walked day holds the boundary
+                # with the days left to walk
+                start_page = (self.checkpoint.pages_walked(key) or [start_page])[-1]
+            self.upload_day(day)
+
+        if not pending:
+            return
+
+        days = self.results_scraper.iter_days_in_range(
+            pending[-1],
+            pending[0],
+            prefetch=self.prefetch,
+            search=start_page == 1,
+            start_page=start_page,
+        )
+        for day, items in days:
+            key = day.to_date_string()
+            if self.checkpoint.day_walked(key):
+                continue
+            self.checkpoint.record_day(
+                key,
+                self.results_scraper.pages_walked,
+                [item.process_item for item in items],
+            )
+            logger.info(f"Checkpointed {len(items)} results for {key}")
+            self.upload_day(day)
+
+    def upload_day(self, day: pendulum.Date) -> None:
+        self.upload_results(day)
+        self.upload_matches(day)
+
+    def upload_results(self, day: pendulum.Date) -> None:
+        key = day.to_date_string()
+        if self.checkpoint.results_uploaded(key):
+            return
+
+        summary = EventsUploader(
+            self.tinybird, VALORANT_RESULTS_DATASOURCE.name
+        ).upload(self.checkpoint.results(key))
+        if summary["failed_rows"] == 0:
+            self.checkpoint.mark_results_uploaded(key)
+
+    def upload_matches(self, day: pendulum.Date) -> None:
+        key = day.to_date_string()
+        links = self.checkpoint.pending_links(key)
+        logger.info(f"{len(links)} matches left to scrape for {key}")
+
+        for offset in range(0, len(links), self.matches_per_checkpoint):
+            group = links[offset : offset + self.matches_per_checkpoint]
+            row_counts = {}
+            team_uploader = EventsUploader(
+                self.tinybird, VALORANT_MATCH_TEAM_RESULTS.name
+            )
+            player_uploader = EventsUploader(
+                self.tinybird, VALORANT_MATCH_PLAYER_RESULTS.name
+            )
+            for match_data in self.matches_scraper.scrape_match_pages(
+                group, concurrency=self.concurrency
+            ):
+                counts = {"team_rows": 0, "player_rows": 0}
+                for game in match_data["games"]:
+                    for row in game["team_results"]:
+                        team_uploader.add(row)
+                    for row in game["player_results"]:
+                        player_uploader.add(row)
+                    counts["team_rows"] += len(game["team_results"])
+                    counts["player_rows"] += len(game["player_results"])
+                row_counts[match_data["match_id"]] = counts
+
+            failed_rows = (
+                team_uploader.close()["failed_rows"]
+                + player_uploader.close()["failed_rows"]
+            )
+            if failed_rows != 0:
+                logger.error(
+                    f"Not checkpointing {len(row_counts)} matches of {key}, "
+                    f"{failed_rows} rows failed to upload"
+                )
+                continue
+            self.checkpoint.record_matches(key, row_counts)
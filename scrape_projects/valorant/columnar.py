@@ -0,0 +1,163 @@
+import re
+
+from loguru import logger
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+from scrape_projects.valorant.datasources import (
+    VALORANT_MATCH_PLAYER_RESULTS,
+    VALORANT_MATCH_TEAM_RESULTS,
+    Datasource,
+)
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+def require_pyarrow() -> None:
+    if pyarrow is None:
+        raise ImportError(
+            "columnar output needs pyarrow, install it with "
+            "`poetry install --extras parquet`"
+        )
+
+
+def clickhouse_to_arrow(column_type: str) -> "pyarrow.DataType":
+    """
+    Arrow type of a datasource column, strings are dictionary encoded since
+    names (players, teams, agents) repeat on most rows
+    """
+    types = {
+        "UInt8": pyarrow.uint8(),
+        "UInt16": pyarrow.uint16(),
+        "UInt32": pyarrow.uint32(),
+        "UInt64": pyarrow.uint64(),
+        "Float32": pyarrow.float32(),
+        "Float64": pyarrow.float64(),
+        "DateTime": pyarrow.timestamp("s", tz="UTC"),
+        "String": pyarrow.dictionary(pyarrow.int32(), pyarrow.string()),
+    }
+    return types[column_type]
+
+
+def arrow_schema(datasource: Datasource) -> "pyarrow.Schema":
+    """
+    Arrow schema mirroring the column names and types of a datasource schema
+    """
+    require_pyarrow()
+    return pyarrow.schema(
+        [
+            (name, clickhouse_to_arrow(column_type))
+            for name, column_type in re.findall(
+                r"(\w+) (\w+) `json:", datasource.schema
+            )
+        ]
+    )
+
+
+class ColumnarBatchBuilder:
+    """
+    Accumulates the export dicts of a datasource into typed arrow record
+    batches of batch_rows rows. With a path every full batch is appended to a
+    parquet file and dropped, otherwise batches are kept until close returns
+    them as a table.
+    """
+
+    def __init__(
+        self,
+        datasource: Datasource,
+        batch_rows: int = 64 * 1024,
+        path: Optional[Union[str, Path]] = None,
+        compression: str = "zstd",
+    ) -> None:
+        require_pyarrow()
+        self.datasource = datasource
+        self.schema = arrow_schema(datasource)
+        self.batch_rows = batch_rows
+        self.path = path
+        self.rows = 0
+        self.batches: List["pyarrow.RecordBatch"] = []
+        self._columns: Dict[str, List[Any]] = {name: [] for name in self.schema.names}
+        self._writer = None
+        if path is not None:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            self._writer = pyarrow.parquet.ParquetWriter(
+                str(path), self.schema, compression=compression
+            )
+
+    def add(self, row: Dict[str, Any]) -> None:
+        for name, values in self._columns.items():
+            values.append(row.get(name))
+        self.rows += 1
+        if len(self._columns[self.schema.names[0]]) >= self.batch_rows:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._columns[self.schema.names[0]]:
+            return
+
+        arrays = []
+        for field in self.schema:
+            values = self._columns[field.name]
+            if pyarrow.types.is_dictionary(field.type):
+                array = pyarrow.array(values, pyarrow.string()).dictionary_encode()
+            else:
+                array = pyarrow.array(values, field.type)
+            arrays.append(array)
+            self._columns[field.name] = []
+
+        batch = pyarrow.RecordBatch.from_arrays(arrays, schema=self.schema)
+        if self._writer is not None:
+            self._writer.write_batch(batch)
+        else:
+            self.batches.append(batch)
+
+    def close(self) -> Optional["pyarrow.Table"]:
+        """
+        Returns the accumulated rows as a table, None when written to parquet
+        """
+        self.flush()
+        if self._writer is not None:
+            self._writer.close()
+            logger.info(f"Wrote {self.rows} {self.datasource.name} rows to {self.path}")
+            return None
+        return pyarrow.Table.from_batches(self.batches, schema=self.schema)
+
+
+class MatchResultBatches:
+    """
+    Team and player rows of scraped matches as columnar batches, written to
+    {directory}/{datasource name}.parquet when a directory is given
+    """
+
+    def __init__(
+        self, batch_rows: int = 64 * 1024, directory: Optional[Union[str, Path]] = None
+    ) -> None:
+        self.builders = {
+            datasource.name: ColumnarBatchBuilder(
+                datasource,
+                batch_rows=batch_rows,
+                path=None
+                if directory is None
+                else Path(directory) / f"{datasource.name}.parquet",
+            )
+            for datasource in (
+                VALORANT_MATCH_TEAM_RESULTS,
+                VALORANT_MATCH_PLAYER_RESULTS,
+            )
+        }
+
+    def add_match(self, match_data: Dict[str, Any]) -> None:
+        team_builder = self.builders[VALORANT_MATCH_TEAM_RESULTS.name]
+        player_builder = self.builders[VALORANT_MATCH_PLAYER_RESULTS.name]
+        for game in match_data["games"]:
+            for row in game["team_results"]:
+                team_builder.add(row)
+            for row in game["player_results"]:
+                player_builder.add(row)
+
+    def close(self) -> Dict[str, Optional["pyarrow.Table"]]:
+        return {name: builder.close() for name, builder in self.builders.items()}
@@ -0,0 +1,183 @@
+import threading
+import time
+
+from collections import OrderedDict
+from loguru import logger
+from typing import Dict, List, Optional, Tuple
+
+from scrape_projects.metrics import metrics
+from scrape_projects.tinybird import EventsUploader, TinyBirdApi
+from scrape_projects.valorant import (
+    ValorantMatches,
+    ValorantResults,
+    split_match_link,
+)
+from scrape_projects.valorant.datasources import VALORANT_RESULTS_DATASOURCE
+from scrape_projects.valorant.items import ValorantResultItem
+from scrape_projects.valorant.pipeline import scrape_and_upload_matches
+
+
+def match_id(link: str) -> Optional[int]:
+    try:
+        return split_match_link(link)[0]
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+class IngestionDaemon:
+    """
+    Polls the first results page every interval seconds and uploads what is
+    new since the last poll: the results not uploaded before and the team and
+    player rows of the results that got map and player stats. Every poll is
+    uploaded as its own micro batch. When a whole page is new the next one is
+    polled too, up to max_pages pages.
+
+    A result is only remembered once the results upload reported no failed
+    rows, and a match once its rows were uploaded without failures (or it is
+    in the match index), so anything that failed is retried at the next poll.
+    The last max_seen links of each are kept in memory. With seed the first
+    poll only records the results already listed, so a restart does not upload
+    them again; their matches are scraped unless the match index has them, or
+    recorded as well when there is no match index to tell.
+    """
+
+    def __init__(
+        self,
+        results_scraper: ValorantResults,
+        matches_scraper: ValorantMatches,
+        tinybird: TinyBirdApi,
+        interval: float = 300.0,
+        max_pages: int = 3,
+        concurrency: int = 4,
+        seed: bool = True,
+        max_seen: int = 10_000,
+    ) -> None:
+        self.results_scraper = results_scraper
+        self.matches_scraper = matches_scraper
+        self.tinybird = tinybird
+        self.interval = interval
+        self.max_pages = max_pages
+        self.concurrency = concurrency
+        self.seed = seed
+        self.max_seen = max_seen
+        # links whose result row / match rows made it to tinybird, oldest first
+        self.results_uploaded: OrderedDict[str, None] = OrderedDict()
+        self.matches_uploaded: OrderedDict[str, None] = OrderedDict()
+        self.stopped = threading.Event()
+
+    def stop(self) -> None:
+        self.stopped.set()
+
+    def run(self, polls: Optional[int] = None) -> None:
+        """
+        Polls until stop is called (or polls polls were made), a failed poll is
+        logged and retried at the next interval
+        """
+        poll = 0
+        while not self.stopped.is_set() and (polls is None or poll < polls):
+            started = time.monotonic()
+            try:
+                self.poll()
+            except Exception as exception:
+                logger.error(f"Poll failed - {exception!r}")
+                metrics.inc("scrape_failures_total", page="poll")
+            poll += 1
+            metrics.write_from_env("valorant_daemon")
+            if polls is None or poll < polls:
+                self.stopped.wait(max(self.interval - (time.monotonic() - started), 0))
+
+    def poll(self) -> Dict[str, Dict[str, int]]:
+        new_results, links = self.diff(self.new_items())
+        if self.seed:
+            self.seed = False
+            self.remember(self.results_uploaded, [item.link for item in new_results])
+            if self.matches_scraper.match_index is None:
+                self.remember(self.matches_uploaded, links)
+            logger.info(f"Seeded with {len(new_results)} listed results")
+            return {}
+
+        logger.info(
+            f"{len(new_results)} new results, {len(links)} new matches to scrape"
+        )
+        if not new_results and not links:
+            return {}
+
+        with metrics.timer("poll_upload_seconds"):
+            with EventsUploader(
+                self.tinybird, VALORANT_RESULTS_DATASOURCE.name
+            ) as results_uploader:
+                for item in new_results:
+                    results_uploader.add(item.process_item)
+                summaries, uploaded = scrape_and_upload_matches(
+                    self.matches_scraper,
+                    self.tinybird,
+                    links,
+                    concurrency=self.concurrency,
+                    match_index=self.matches_scraper.match_index,
+                )
+
+        if results_uploader.summary["failed_rows"] == 0:
+            self.remember(self.results_uploaded, [item.link for item in new_results])
+        self.remember(
+            self.matches_uploaded,
+            [link for link in links if match_id(link) in uploaded],
+        )
+        return summaries | {VALORANT_RESULTS_DATASOURCE.name: results_uploader.summary}
+
+    def new_items(self) -> List[ValorantResultItem]:
+        """
+        Results of the first pages, following the next page only while every
+        result of the current one is new
+        """
+        items = []
+        for page in range(1, self.max_pages + 1):
+            matches = self.results_scraper.scrape_results_page(page)
+            items += matches
+            if not matches or any(
+                match.link in self.results_uploaded for match in matches
+            ):
+                break
+        else:
+            if self.results_uploaded:
+                logger.warning(
+                    f"Every result of the first {self.max_pages} pages is new, "
+                    "some may have been missed (poll more often or raise max_pages)"
+                )
+        return items
+
+    def diff(
+        self, items: List[ValorantResultItem]
+    ) -> Tuple[List[ValorantResultItem], List[str]]:
+        """
+        Returns the results not uploaded yet and the links of the matches to
+        scrape (results that got their stats and whose rows are not uploaded
+        yet), oldest first
+        """
+        match_index = self.matches_scraper.match_index
+        new_results, links = [], []
+        for item in reversed(items):
+            if item.link not in self.results_uploaded:
+                new_results.append(item)
+            if not item.has_stats or item.link in self.matches_uploaded:
+                continue
+            item_match_id = match_id(item.link)
+            if item_match_id is None:
+                # never scrapable, not worth retrying at every poll
+                logger.error(f"Invalid match link {item.link!r}")
+                self.remember(self.matches_uploaded, [item.link])
+            elif match_index is not None and item_match_id in match_index:
+                self.remember(self.matches_uploaded, [item.link])
+            else:
+                links.append(item.link)
+        return new_results, links
+
+    def remember(self, seen: "OrderedDict[str, None]", links: List[str]) -> None:
+        """
+        Adds links (oldest first) to seen, forgetting the oldest ones beyond
+        max_seen
+        """
+        for link in links:
+            seen[link] = None
+            seen.move_to_end(link)
+        while len(seen) > self.max_seen:
+            seen.popitem(last=False)
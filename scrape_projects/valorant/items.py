@@ -3,8 +3,9 @@ import datetime
 import json
 import pendulum
 
+from functools import lru_cache
 from pendulum.tz.timezone import Timezone
-from typing import Any, Dict, List, Literal, Optional
+from typing import Any, Callable, Dict, List, Literal, Optional, Tuple
 
 
 def player_stats_process(value: Optional[str]) -> Optional[str]:
@@ -43,6 +44,10 @@ def current_timezone_process(value: Optional[Timezone]) -> Optional[Timezone]:
     return value
 
 
+def start_timestamp_process(value: Optional[pendulum.DateTime]) -> Optional[str]:
+    return value.isoformat() if value is not None else None
+
+
 def try_pendulum_timestamp(
     timestamp: str, format: str, timezone: Timezone = pendulum.timezone("UTC")
 ):
@@ -56,7 +61,93 @@ def try_pendulum_timestamp(
         return None
 
 
-@dataclasses.dataclass
+@lru_cache(maxsize=4096)
+def parse_date_header(value: Optional[str]) -> Optional[Tuple[int, int, int]]:
+    """
+    (year, month, day) of a results page date header (e.g. Fri, October 14,
+    2022), every match listed under the header shares it
+    """
+    try:
+        date = pendulum.from_format(str(value), "ddd, MMMM DD, YYYY")
+    except ValueError:
+        return None
+    return date.year, date.month, date.day
+
+
+@lru_cache(maxsize=2048)
+def parse_time_of_day(value: Optional[str]) -> Optional[Tuple[int, int]]:
+    """
+    (hour, minute) of a match time (e.g. 10:00 PM)
+    """
+    try:
+        time = pendulum.from_format(str(value), "hh:mm A")
+    except ValueError:
+        return None
+    return time.hour, time.minute
+
+
+def match_start_timestamp(
+    start_date: Optional[str], start_time: Optional[str], timezone: Timezone
+) -> Optional[pendulum.DateTime]:
+    """
+    UTC datetime of a match start, same instant as try_pendulum_timestamp with
+    the "ddd, MMMM DD, YYYY hh:mm A" format but both halves are parsed once
+    """
+    date = parse_date_header(start_date)
+    time = parse_time_of_day(start_time)
+    if date is None or time is None:
+        return None
+    try:
+        return pendulum.datetime(*date, *time, tz=timezone).astimezone(
+            pendulum.timezone("UTC")
+        )
+    except ValueError:
+        return None
+
+
+def exported_keys(cls: type) -> Tuple[str, ...]:
+    """
+    Properties (alphabetically) followed by the public fields of a dataclass
+    """
+    properties = [name for name in dir(cls) if isinstance(getattr(cls, name), property)]
+    fields = [
+        field.name
+        for field in dataclasses.fields(cls)
+        if not field.name.startswith("_")
+    ]
+    return tuple(properties + fields)
+
+
+def build_exporter(
+    cls: type,
+    keys: Tuple[str, ...],
+    converters: Optional[Dict[str, Callable[[Any], Any]]] = None,
+) -> Callable[[Any], Dict[str, Any]]:
+    """
+    Generates a function building the export dict of a cls instance in a single
+    expression. Keys with a converter are converted from the attribute of the
+    same name, properties are computed through their getter and the remaining
+    keys are copied as is, so nothing is looked up per row.
+    """
+    converters = converters or {}
+    namespace: Dict[str, Any] = {}
+    values = []
+    for key in keys:
+        if key in converters:
+            namespace[f"convert_{key}"] = converters[key]
+            values.append(f"{key!r}: convert_{key}(item.{key})")
+        elif isinstance(getattr(cls, key, None), property):
+            namespace[f"get_{key}"] = getattr(cls, key).fget
+            values.append(f"{key!r}: get_{key}(item)")
+        else:
+            values.append(f"{key!r}: item.{key}")
+
+    source = f"def export_{cls.__name__}(item):\n    return {{{', '.join(values)}}}\n"
+    exec(source, namespace)
+    return namespace[f"export_{cls.__name__}"]
+
+
+@dataclasses.dataclass(slots=True)
 class ValorantResultItem:
     link: Optional[str] = dataclasses.field(default=None)
     start_date: Optional[datetime.date] = dataclasses.field(default=None)
@@ -67,24 +158,50 @@ class ValorantResultItem:
     status: Optional[str] = dataclasses.field(default=None)
     event: Optional[str] = dataclasses.field(default=None)
     current_timezone: Timezone = dataclasses.field(default=pendulum.now().tz)
+    # UTC datetime computed from start_date, start_time and current_timezone,
+    # only the exporter turns it into an isoformat string
+    start_timestamp: Optional[pendulum.DateTime] = dataclasses.field(default=None)
+
+    def __post_init__(self) -> None:
+        if self.start_timestamp is None:
+            self.start_timestamp = match_start_timestamp(
+                self.start_date, self.start_time, self.current_timezone
+            )
 
     @property
     def process_item(self) -> str:
-        data = dataclasses.asdict(self)
-        data["player_stats"] = player_stats_process(data.get("player_stats", None))
-        data["map_stats"] = map_stats_process(data.get("map_stats", None))
-        data["start_timestamp"] = try_pendulum_timestamp(
-            f"{data.get('start_date', None)} {data.get('start_time', None)}",
-            "ddd, MMMM DD, YYYY hh:mm A",
-            self.current_timezone,
+        return json.dumps(export_valorant_result_item(self))
+
+    @property
+    def has_stats(self) -> bool:
+        """
+        Whether the match page holds map and player stats worth scraping
+        """
+        return map_stats_process(self.map_stats) and player_stats_process(
+            self.player_stats
         )
-        fields_to_pop = ["start_date", "start_time", "current_timezone"]
-        for field in fields_to_pop:
-            data.pop(field)
-        return json.dumps(data)
 
 
-@dataclasses.dataclass
+export_valorant_result_item = build_exporter(
+    ValorantResultItem,
+    (
+        "link",
+        "player_stats",
+        "map_stats",
+        "stakes",
+        "status",
+        "event",
+        "start_timestamp",
+    ),
+    converters={
+        "player_stats": player_stats_process,
+        "map_stats": map_stats_process,
+        "start_timestamp": start_timestamp_process,
+    },
+)
+
+
+@dataclasses.dataclass(slots=True)
 class TeamResult:
     match_id: int
     patch: float
@@ -130,16 +247,27 @@ class TeamResult:
 
     @property
     def export(self) -> Dict[str, Any]:
-        return {
-            "result": self.result,
-            "score": self.score,
-            "defense_score": self.defense_score,
-            "attack_score": self.attack_score,
-            "start_side": self.start_side,
-        } | {key: self.__dict__[key] for key in self.export_keys}
-
-
-@dataclasses.dataclass
+        return export_team_result(self)
+
+
+export_team_result = build_exporter(
+    TeamResult,
+    (
+        "result",
+        "score",
+        "defense_score",
+        "attack_score",
+        "start_side",
+        "match_id",
+        "patch",
+        "game_id",
+        "team_id",
+        "team_name",
+    ),
+)
+
+
+@dataclasses.dataclass(slots=True)
 class PlayerResult:
     match_id: int
     game_id: int
@@ -158,7 +286,7 @@ class PlayerResult:
     _hs: str
 
     def convert_to_int(self, attribute: str) -> int:
-        return int(self.__dict__[attribute])
+        return int(getattr(self, attribute))
 
     @property
     def kills(self) -> int:
@@ -188,7 +316,7 @@ class PlayerResult:
     def kast(self) -> Optional[int]:
         try:
             return int(self._kast[:-1])
-        except ValueError:
+        except (TypeError, ValueError):
             return None
 
     @property
@@ -201,9 +329,7 @@ class PlayerResult:
 
     # @property
     def export(self) -> Dict[str, Any]:
-        return self.get_properties() | {
-            x: y for x, y in dataclasses.asdict(self).items() if not x.startswith("_")
-        }
+        return export_player_result(self)
 
     def get_properties(self) -> Dict[str, Any]:
         properties = {}
@@ -214,7 +340,10 @@ class PlayerResult:
         return properties
 
 
-@dataclasses.dataclass
+export_player_result = build_exporter(PlayerResult, exported_keys(PlayerResult))
+
+
+@dataclasses.dataclass(slots=True)
 class GameMetaData:
     match_id: int
     _blah: int
@@ -224,9 +353,7 @@ class GameMetaData:
         return 2
 
     def export(self) -> Dict[str, Any]:
-        return self.get_properties() | {
-            x: y for x, y in dataclasses.asdict(self).items() if not x.startswith("_")
-        }
+        return export_game_meta_data(self)
 
     def get_properties(self) -> Dict[str, Any]:
         properties = {}
@@ -235,3 +362,6 @@ class GameMetaData:
             if isinstance(obj, property):
                 properties[name] = obj.__get__(self, self.__class__)
         return properties
+
+
+export_game_meta_data = build_exporter(GameMetaData, exported_keys(GameMetaData))
@@ -0,0 +1,129 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+from loguru import logger
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional, Union
+
+from scrape_projects.tinybird import TinyBirdApi
+from scrape_projects.valorant.datasources import VALORANT_MATCH_PLAYER_RESULTS
+
+
+def match_content_hash(match_data: Dict[str, Any]) -> str:
+    """
+    sha256 of the team and player rows scraped for a match, the same rows
+    always give the same hash so a rescrape can tell whether anything changed
+    """
+    rows = [
+        [game["team_results"], game["player_results"]] for game in match_data["games"]
+    ]
+    return hashlib.sha256(
+        json.dumps(rows, sort_keys=True, separators=(",", ":")).encode()
+    ).hexdigest()
+
+
+class MatchIndex:
+    """
+    Persistent sqlite index of the match ids whose team and player rows were
+    uploaded, along with the content hash of those rows. Matches rebuilt from
+    tinybird have no hash since the rows are not downloaded.
+    """
+
+    def __init__(self, path: Union[str, Path] = ":memory:") -> None:
+        self.path = path
+        self._lock = threading.Lock()
+
+        if str(path) != ":memory:":
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+
+        self._connection = sqlite3.connect(str(path), check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute(
+                "create table if not exists matches ("
+                "match_id integer primary key, content_hash text, indexed_at real)"
+            )
+
+    def __contains__(self, match_id: int) -> bool:
+        with self._lock:
+            return (
+                self._connection.execute(
+                    "select 1 from matches where match_id = ?", (match_id,)
+                ).fetchone()
+                is not None
+            )
+
+    def __len__(self) -> int:
+        with self._lock:
+            (count,) = self._connection.execute(
+                "select count(*) from matches"
+            ).fetchone()
+        return count
+
+    def get_hash(self, match_id: int) -> Optional[str]:
+        with self._lock:
+            row = self._connection.execute(
+                "select content_hash from matches where match_id = ?", (match_id,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def add(self, match_id: int, content_hash: Optional[str] = None) -> None:
+        self.add_many({match_id: content_hash})
+
+    def add_many(self, content_hashes: Dict[int, Optional[str]]) -> None:
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "insert or replace into matches values (?, ?, ?)",
+                [
+                    (match_id, content_hash, now)
+                    for match_id, content_hash in content_hashes.items()
+                ],
+            )
+
+    def rebuild(self, match_ids: Iterable[int]) -> int:
+        """
+        Replaces the index with match_ids, known hashes are kept
+        """
+        now = time.time()
+        with self._lock, self._connection:
+            # ddl runs outside the transaction, a failed rebuild leaves the
+            # table behind (and possibly filled) for the next one to reuse
+            self._connection.execute(
+                "create temp table if not exists rebuilt (match_id integer primary key)"
+            )
+            self._connection.execute("delete from rebuilt")
+            self._connection.executemany(
+                "insert or ignore into rebuilt values (?)",
+                ((match_id,) for match_id in match_ids),
+            )
+            self._connection.execute(
+                "delete from matches where match_id not in (select match_id from rebuilt)"
+            )
+            self._connection.execute(
+                "insert or ignore into matches "
+                "select match_id, null, ? from rebuilt",
+                (now,),
+            )
+            self._connection.execute("drop table rebuilt")
+        return len(self)
+
+    def rebuild_from_tinybird(self, tinybird: TinyBirdApi) -> int:
+        """
+        Rebuilds the index from every match id holding player rows in tinybird
+        with a single query
+        """
+        response = tinybird.query_pipe(
+            f"select distinct match_id from {VALORANT_MATCH_PLAYER_RESULTS.name} "
+            "format JSON"
+        )
+        response.raise_for_status()
+        indexed = self.rebuild(row["match_id"] for row in response.json()["data"])
+        logger.info(f"Rebuilt match index with {indexed} matches from tinybird")
+        return indexed
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,88 @@
+import os
+
+from loguru import logger
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, Optional, Set, Tuple
+
+from scrape_projects.tinybird import TinyBirdApi, upload_to_datasources
+from scrape_projects.valorant import ValorantMatches, match_rows
+from scrape_projects.valorant.items import ValorantResultItem
+from scrape_projects.valorant.match_index import MatchIndex, match_content_hash
+
+if TYPE_CHECKING:
+    from scrape_projects.valorant.columnar import MatchResultBatches
+
+
+def match_index_from_env(tinybird: TinyBirdApi) -> MatchIndex:
+    """
+    Opens the match index at VLR_MATCH_INDEX_PATH, rebuilt with a single query
+    when the index file is new (e.g. on a fresh github runner)
+    """
+    match_index = MatchIndex(
+        os.environ.get("VLR_MATCH_INDEX_PATH", "match_index.sqlite3")
+    )
+    if len(match_index) == 0:
+        match_index.rebuild_from_tinybird(tinybird)
+    return match_index
+
+
+def archive_from_env(day: str) -> Optional["MatchResultBatches"]:
+    """
+    Parquet archive of the uploaded rows in $VLR_PARQUET_DIR/{day}/, None when
+    that variable is not set
+    """
+    parquet_directory = os.environ.get("VLR_PARQUET_DIR")
+    if not parquet_directory:
+        return None
+    # pyarrow is only loaded when archiving
+    from scrape_projects.valorant.columnar import MatchResultBatches
+
+    return MatchResultBatches(directory=Path(parquet_directory) / day)
+
+
+def links_with_stats(items: Iterable[ValorantResultItem]) -> Iterator[str]:
+    """
+    Links of the results whose match page holds map and player stats
+    """
+    for item in items:
+        if item.has_stats:
+            yield item.link
+        else:
+            logger.warning(f"No map and/or player stats for {item.link}")
+
+
+def scrape_and_upload_matches(
+    scraper: ValorantMatches,
+    tinybird: TinyBirdApi,
+    links: Iterable[str],
+    concurrency: int = 8,
+    match_index: Optional[MatchIndex] = None,
+    archive: Optional["MatchResultBatches"] = None,
+) -> Tuple[Dict[str, Dict[str, int]], Set[int]]:
+    """
+    Scrapes the match pages of links as they come in (links can be a generator
+    still walking results pages) and streams their team and player rows to
+    tinybird. The matches are added to the index only when every row made it
+    to tinybird. Returns the upload summary of every datasource and the ids of
+    the uploaded matches (none when any row failed).
+    """
+    content_hashes = {}
+
+    def rows_to_upload():
+        for result in scraper.scrape_match_pages(links, concurrency=concurrency):
+            content_hashes[result["match_id"]] = match_content_hash(result)
+            if archive is not None:
+                archive.add_match(result)
+            yield from match_rows(result)
+
+    summaries = upload_to_datasources(tinybird, rows_to_upload())
+
+    if archive is not None:
+        archive.close()
+
+    failed_rows = sum(summary["failed_rows"] for summary in summaries.values())
+    if failed_rows:
+        return summaries, set()
+    if match_index is not None:
+        match_index.add_many(content_hashes)
+    return summaries, set(content_hashes)
@@ -1,23 +1,32 @@
-import json
+"""
+Recovery path of scrape_valorant_pipeline.py: scrapes and uploads the team and
+player rows of the matches of the last day by reading the results back from
+tinybird, e.g. when the pipeline uploaded the results but failed on matches.
+"""
 import os
 import pendulum
 from loguru import logger
 from pathlib import Path
 
-# from scrape_projects.tinybird import TinyBirdApi
-from scrape_projects.tinybird import ValorantDatasourceApi, TinyBirdApi
+from scrape_projects.metrics import metrics
+from scrape_projects.tinybird import TinyBirdApi, ValorantDatasourceApi
 from scrape_projects.valorant import (
     ValorantMatches,
     ValorantStatistics,
+    cache_from_env,
 )
-
-from scrape_projects.valorant.datasources import (
-    VALORANT_RESULTS_DATASOURCE,
-    VALORANT_MATCH_PLAYER_RESULTS,
-    VALORANT_MATCH_TEAM_RESULTS,
+from scrape_projects.valorant.pipeline import (
+    archive_from_env,
+    match_index_from_env,
+    scrape_and_upload_matches,
 )
 
-consumer = ValorantStatistics()
+tinybird_append = TinyBirdApi(os.environ.get("TB_API_TOKEN"))
+
+# matches whose rows are already in tinybird
+match_index = match_index_from_env(tinybird_append)
+
+consumer = ValorantStatistics(cache=cache_from_env())
 scraper = ValorantMatches(
     config_path=Path(__file__).parent
     / "scrape_projects"
@@ -25,6 +34,8 @@ scraper = ValorantMatches(
     / "configs"
     / "vlr-gg-matches.yml",
     consumer=consumer,
+    parse_workers=int(os.environ.get("VLR_PARSE_WORKERS", 0)),
+    match_index=match_index,
 )
 
 tinybird = ValorantDatasourceApi(os.environ.get("TB_API_TOKEN"))
@@ -40,34 +51,22 @@ logger.info(
     f"{len(matches_to_scrape['data'])} retrieved for {start_day_utc.isoformat()} to {end_day_utc.isoformat()}"
 )
 
-results = []
+links_to_scrape = []
 for match in matches_to_scrape["data"]:
     if match["map_stats"] and match["player_stats"]:
-        logger.info(f"Working on: {match['link']}")
-        split_link = match["link"].split("/")
-        results.append(
-            scraper.scrape_match_page(
-                match_id=int(split_link[1]), match_stub=split_link[2]
-            )
-        )
+        links_to_scrape.append(match["link"])
     else:
         logger.warning(f"No map and/or player stats for {match['link']}")
 
-team_results = []
-player_results = []
-for result in results:
-    for game in result["games"]:
-        team_results += game["team_results"]
-        player_results += game["player_results"]
-
-
-team_results_dump = "\n".join([json.dumps(result) for result in team_results])
-player_results_dump = "\n".join([json.dumps(result) for result in player_results])
-
-tinybird_append = TinyBirdApi(os.environ.get("TB_API_TOKEN"))
+scrape_and_upload_matches(
+    scraper,
+    tinybird_append,
+    links_to_scrape,
+    match_index=match_index,
+    archive=archive_from_env(start_day_utc.to_date_string()),
+)
 
-response = tinybird_append.append_events(name=VALORANT_MATCH_PLAYER_RESULTS.name, wait=True, data=player_results_dump)
-print(response.json())
-response = tinybird_append.append_events(name=VALORANT_MATCH_TEAM_RESULTS.name, wait=True, data=team_results_dump)
-print(response.json())
+scraper.close()
+match_index.close()
 
+metrics.write_from_env("valorant_matches")
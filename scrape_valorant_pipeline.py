@@ -0,0 +1,66 @@
+"""
+Nightly pipeline: walks the results pages of the last day and uploads the
+results while the match pages of the results with stats are already being
+scraped and their team and player rows uploaded, without reading the results
+back from tinybird (see scrape_valorant_matches_daily.py for that).
+"""
+import os
+import pendulum
+from pathlib import Path
+
+from scrape_projects.metrics import metrics
+from scrape_projects.tinybird import EventsUploader, TinyBirdApi
+from scrape_projects.valorant import (
+    ValorantMatches,
+    ValorantResults,
+    ValorantStatistics,
+    cache_from_env,
+)
+from scrape_projects.valorant.datasources import VALORANT_RESULTS_DATASOURCE
+from scrape_projects.valorant.pipeline import (
+    archive_from_env,
+    links_with_stats,
+    match_index_from_env,
+    scrape_and_upload_matches,
+)
+
+tinybird = TinyBirdApi(os.environ.get("TB_API_TOKEN"))
+match_index = match_index_from_env(tinybird)
+
+consumer = ValorantStatistics(cache=cache_from_env())
+results_scraper = ValorantResults(consumer=consumer)
+matches_scraper = ValorantMatches(
+    config_path=Path(__file__).parent
+    / "scrape_projects"
+    / "valorant"
+    / "configs"
+    / "vlr-gg-matches.yml",
+    consumer=consumer,
+    parse_workers=int(os.environ.get("VLR_PARSE_WORKERS", 0)),
+    match_index=match_index,
+)
+
+start_day_utc = pendulum.now("UTC").start_of("day").subtract(days=2)
+
+
+def uploaded_results(uploader: EventsUploader):
+    # every result is uploaded as the walk goes, before its match is scraped
+    for item in results_scraper.iter_matches_from_last_day(prefetch=2):
+        uploader.add(item.process_item)
+        yield item
+
+
+with EventsUploader(tinybird, VALORANT_RESULTS_DATASOURCE.name) as results_uploader:
+    scrape_and_upload_matches(
+        matches_scraper,
+        tinybird,
+        links_with_stats(uploaded_results(results_uploader)),
+        match_index=match_index,
+        archive=archive_from_env(start_day_utc.to_date_string()),
+    )
+
+results_scraper.close()
+matches_scraper.close()
+match_index.close()
+
+metrics.write_from_env("valorant_pipeline")
@@ -0,0 +1,142 @@
+import gzip
+import json
+import pendulum
+import threading
+
+from requests import Response
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+from typing import Optional
+
+from scrape_projects.valorant.items import ValorantResultItem
+
+URL = "https://www.vlr.gg"
+UTC = pendulum.timezone("UTC")
+
+
+class FakeAdapter(BaseAdapter):
+    """
+    Answers every request with the next queued answer: a status code, a
+    (status code, headers, body) tuple or an exception to raise. Once the
+    queue is empty requests get a 200 whose body is their number. Requests
+    whose number is in slow take half a second (or until release is set).
+    """
+
+    def __init__(self, *answers, headers=None, slow=()) -> None:
+        super().__init__()
+        self.answers = list(answers)
+        self.headers = headers or {}
+        self.slow = set(slow)
+        self.requests = []
+        self.release = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def sent(self) -> int:
+        return len(self.requests)
+
+    def send(self, request, **kwargs):
+        with self._lock:
+            self.requests.append(request)
+            number = len(self.requests)
+            answer = self.answers.pop(0) if self.answers else 200
+        if number in self.slow:
+            self.release.wait(0.5)
+        if isinstance(answer, Exception):
+            raise answer
+        status_code, headers, body = (
+            answer if isinstance(answer, tuple) else (answer, self.headers, None)
+        )
+        response = Response()
+        response.status_code = status_code
+        response.headers = CaseInsensitiveDict(headers)
+        response._content = str(number).encode() if body is None else body
+        response._content_consumed = True
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        self.release.set()
+
+
+def result(
+    match_id: int,
+    start: Optional[pendulum.DateTime] = None,
+    has_stats: bool = True,
+) -> ValorantResultItem:
+    # the higher the id the older the match unless start is given
+    start = start or pendulum.datetime(2022, 10, 15, 20).subtract(hours=match_id)
+    return ValorantResultItem(
+        link=f"/{match_id}/match-{match_id}",
+        start_date=start.format("ddd, MMMM DD, YYYY"),
+        start_time=start.format("hh:mm A"),
+        player_stats="Player" if has_stats else "",
+        map_stats="Map" if has_stats else "",
+        current_timezone=UTC,
+    )
+
+
+def match_ids(links):
+    return [int(link.split("/")[1]) for link in links]
+
+
+class FakeMatches:
+    """
+    Matches scraper with one team and two player rows per match. The matches
+    in fail are skipped like a match page that could not be fetched, getting
+    to fail_on raises to simulate an interrupted run.
+    """
+
+    def __init__(self, match_index=None, fail_on=None) -> None:
+        self.match_index = match_index
+        self.fail_on = fail_on
+        self.fail = set()
+        self.scraped = []
+
+    def scrape_match_pages(self, links, concurrency=8):
+        for link in links:
+            (match_id,) = match_ids([link])
+            if match_id == self.fail_on:
+                raise RuntimeError(f"interrupted at {link}")
+            self.scraped.append(match_id)
+            if match_id in self.fail:
+                continue
+            yield {
+                "match_id": match_id,
+                "games": [
+                    {
+                        "team_results": [{"match_id": match_id}],
+                        "player_results": [{"match_id": match_id}] * 2,
+                    }
+                ],
+            }
+
+
+class FakeTinybird:
+    """
+    Records the uploaded rows by datasource, the datasources in failing answer
+    with a 400
+    """
+
+    def __init__(self) -> None:
+        self.rows = {}
+        self.failing = set()
+
+    def append_compressed_events(self, name, wait, data):
+        response = Response()
+        if name in self.failing:
+            response.status_code = 400
+            response._content = b"rejected"
+            return response
+        rows = [json.loads(row) for row in gzip.decompress(data).split(b"\n")]
+        self.rows.setdefault(name, []).extend(rows)
+        response.status_code = 200
+        response._content = json.dumps({"successful_rows": len(rows)}).encode()
+        return response
+
+    def uploaded(self, datasource, key):
+        """
+        Takes the rows uploaded to datasource so far, returns their key values
+        """
+        return [row[key] for row in self.rows.pop(datasource.name, [])]
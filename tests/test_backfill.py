@@ -0,0 +1,158 @@
+import pendulum
+import pytest
+
+from scrape_projects.valorant import ValorantResults
+from scrape_projects.valorant.backfill import BackfillCheckpoint, BackfillRunner
+from scrape_projects.valorant.datasources import (
+    VALORANT_MATCH_PLAYER_RESULTS,
+    VALORANT_MATCH_TEAM_RESULTS,
+    VALORANT_RESULTS_DATASOURCE,
+)
+from tests.fakes import FakeMatches, FakeTinybird, match_ids, result
+
+
+def results_of_day(day: int, count: int = 3):
+    # newest first, like the results pages
+    hours = (20, 14, 8)[:count]
+    return [
+        result(day * 10 + index, pendulum.datetime(2022, 10, day, hour))
+        for index, hour in enumerate(hours)
+    ]
+
+
+# 2 matches on the 15th, 3 on the 14th, 13th, 11th and 10th, none on the 12th,
+# match ids are day * 10 + n, 4 matches per page:
+# [150 151 140 141] [142 130 131 132] [110 111 112 100] [101 102]
+RESULTS = (
+    results_of_day(15, 2)
+    + results_of_day(14)
+    + results_of_day(13)
+    + results_of_day(11)
+    + results_of_day(10)
+)
+PAGES = {page + 1: RESULTS[page * 4 : page * 4 + 4] for page in range(4)}
+
+
+def result_ids(items):
+    return match_ids(item.link for item in items)
+
+
+class FakeResults(ValorantResults):
+    """
+    Results scraper serving PAGES, recording the pages fetched and the walks
+    """
+
+    def __init__(self) -> None:
+        super().__init__(consumer=object(), timezone="UTC")
+        self.fetched = []
+        self.walks = []
+
+    def scrape_results_page(self, page):
+        return self.fetch_and_parse_results_page(page)
+
+    def fetch_and_parse_results_page(self, page):
+        self.fetched.append(page)
+        return list(PAGES.get(page, []))
+
+    def iter_days_in_range(self, start, end, **options):
+        self.walks.append(
+            (start.to_date_string(), end.to_date_string(), options.get("start_page", 1))
+        )
+        return super().iter_days_in_range(start, end, **options)
+
+
+@pytest.mark.parametrize(
+    "end_interval, start_page, fetched",
+    [
+        (pendulum.datetime(2022, 10, 14), 2, [1, 2]),
+        (pendulum.datetime(2022, 10, 11), 3, [1, 2, 4, 3]),
+    ],
+)
+def test_find_start_page_gallops_then_bisects(end_interval, start_page, fetched):
+    results = FakeResults()
+    page, known_pages = results.find_start_page(end_interval)
+
+    assert page == start_page
+    assert results.fetched == fetched
+    assert sorted(known_pages) == sorted(fetched)
+
+
+def test_iter_days_in_range_walks_the_pages_once():
+    results = FakeResults()
+    days = [
+        (day.to_date_string(), result_ids(items), results.pages_walked)
+        for day, items in results.iter_days_in_range(
+            pendulum.date(2022, 10, 11), pendulum.date(2022, 10, 14)
+        )
+    ]
+
+    assert days == [
+        ("2022-10-14", [140, 141, 142], [1, 2]),
+        ("2022-10-13", [130, 131, 132], [2, 3]),
+        ("2022-10-12", [], [3]),
+        ("2022-10-11", [110, 111, 112], [3]),
+    ]
+    assert results.fetched == [1, 2, 3]
+
+
+def test_iter_days_in_range_searches_the_start_page():
+    results = FakeResults()
+    days = [
+        (day.to_date_string(), result_ids(items))
+        for day, items in results.iter_days_in_range(
+            pendulum.date(2022, 10, 12), pendulum.date(2022, 10, 13), search=True
+        )
+    ]
+
+    assert days == [("2022-10-13", [130, 131, 132]), ("2022-10-12", [])]
+    # pages fetched by the search are not fetched again by the walk
+    assert results.fetched == [1, 2, 3]
+
+
+def test_backfill_resumes_where_it_was_interrupted(tmp_path):
+    start, end = pendulum.date(2022, 10, 11), pendulum.date(2022, 10, 14)
+    checkpoint = BackfillCheckpoint(tmp_path / "backfill.sqlite3")
+    tinybird = FakeTinybird()
+
+    def runner(results, matches):
+        return BackfillRunner(
+            results,
+            matches,
+            tinybird,
+            checkpoint,
+            prefetch=0,
+            matches_per_checkpoint=2,
+        )
+
+    interrupted = FakeResults()
+    with pytest.raises(RuntimeError):
+        runner(interrupted, FakeMatches(fail_on=132)).run(start, end)
+
+    assert interrupted.walks == [("2022-10-11", "2022-10-14", 1)]
+    assert checkpoint.day_walked("2022-10-13")
+    assert not checkpoint.day_walked("2022-10-12")
+    assert checkpoint.pages_walked("2022-10-13") == [2, 3]
+    assert match_ids(checkpoint.pending_links("2022-10-13")) == [132]
+
+    resumed, matches = FakeResults(), FakeMatches()
+    runner(resumed, matches).run(start, end)
+
+    # the walk continues from the last page of the oldest walked day
+    assert resumed.walks == [("2022-10-11", "2022-10-12", 3)]
+    assert resumed.fetched == [3]
+    assert matches.scraped == [132, 110, 111, 112]
+    for day in ("2022-10-14", "2022-10-13", "2022-10-12", "2022-10-11"):
+        assert checkpoint.results_uploaded(day)
+        assert checkpoint.pending_links(day) == []
+
+    # every result and match row was uploaded exactly once
+    expected = [140, 141, 142, 130, 131, 132, 110, 111, 112]
+    uploaded = tinybird.rows[VALORANT_RESULTS_DATASOURCE.name]
+    assert sorted(match_ids(row["link"] for row in uploaded)) == sorted(expected)
+    for datasource, rows_per_match in (
+        (VALORANT_MATCH_TEAM_RESULTS, 1),
+        (VALORANT_MATCH_PLAYER_RESULTS, 2),
+    ):
+        rows = sorted(row["match_id"] for row in tinybird.rows[datasource.name])
+        assert rows == sorted(expected * rows_per_match)
+    checkpoint.close()
@@ -0,0 +1,105 @@
+import pytest
+import random
+
+from requests import Session
+
+from scrape_projects import cache as cache_module
+from scrape_projects.cache import (
+    CacheMissError,
+    CachePolicy,
+    ResponseCache,
+    mount_cache,
+)
+from tests.fakes import URL, FakeAdapter
+
+
+class Clock:
+    def __init__(self, now: float = 1000.0) -> None:
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache_module.time, "time", clock)
+    return clock
+
+
+def cached_session(cache, adapter):
+    session = Session()
+    session.mount(URL, adapter)
+    return mount_cache(session, cache, [URL])
+
+
+def test_policies_decide_what_is_cached_and_for_how_long(clock):
+    cache = ResponseCache(
+        policies=[CachePolicy(r"^/matches/results", ttl=60), CachePolicy(r"^/\d+/")]
+    )
+    cache.put(f"{URL}/matches/results", "/matches/results", 200, {}, b"results")
+    cache.put(f"{URL}/123/match", "/123/match", 200, {}, b"match")
+    assert not cache.put(f"{URL}/news", "/news", 200, {}, b"news")
+    assert not cache.put(f"{URL}/456/match", "/456/match", 500, {}, b"error")
+
+    clock.now += 61
+    assert cache.get(f"{URL}/matches/results", "/matches/results") is None
+    expired = cache.get(f"{URL}/matches/results", "/matches/results", True)
+    assert expired.expired and expired.body == b"results"
+    assert cache.get(f"{URL}/123/match", "/123/match").body == b"match"
+    assert cache.get(f"{URL}/456/match", "/456/match") is None
+
+
+def test_least_recently_used_entries_are_evicted_by_size(clock):
+    cache = ResponseCache(policies=[CachePolicy(r".")], max_size=250)
+    # random bytes do not compress, so every entry stores about 100 bytes
+    bodies = {path: random.Random(path).randbytes(100) for path in (1, 2, 3)}
+    for path in (1, 2):
+        clock.now += 1
+        cache.put(f"{URL}/{path}", f"/{path}", 200, {}, bodies[path])
+
+    clock.now += 1
+    assert cache.get(f"{URL}/1", "/1") is not None
+    clock.now += 1
+    cache.put(f"{URL}/3", "/3", 200, {}, bodies[3])
+
+    assert cache.get(f"{URL}/2", "/2") is None
+    assert cache.get(f"{URL}/1", "/1").body == bodies[1]
+    assert cache.get(f"{URL}/3", "/3").body == bodies[3]
+
+
+def test_replay_only_raises_on_missing_responses(clock):
+    cache = ResponseCache(policies=[CachePolicy(r".", ttl=1)], replay_only=True)
+    cache.put(f"{URL}/1", "/1", 200, {}, b"stored")
+    adapter = FakeAdapter()
+    session = cached_session(cache, adapter)
+
+    clock.now += 10
+    response = session.get(f"{URL}/1")
+    assert response.headers["X-Cache"] == "HIT"
+    assert response.content == b"stored"
+    with pytest.raises(CacheMissError):
+        session.get(f"{URL}/2")
+    assert adapter.requests == []
+
+
+def test_not_modified_returns_the_stored_body_as_revalidated(clock):
+    cache = ResponseCache(policies=[CachePolicy(r".", ttl=60)])
+    adapter = FakeAdapter(
+        (200, {"ETag": '"v1"', "Content-Type": "text/html"}, b"page"),
+        (304, {"ETag": '"v1"'}, b""),
+    )
+    session = cached_session(cache, adapter)
+
+    assert session.get(f"{URL}/1").content == b"page"
+    clock.now += 61
+    response = session.get(f"{URL}/1")
+
+    assert adapter.requests[1].headers["If-None-Match"] == '"v1"'
+    assert response.status_code == 200
+    assert response.headers["X-Cache"] == "REVALIDATED"
+    assert response.content == b"page"
+    # the 304 made the stored response fresh again
+    assert session.get(f"{URL}/1").headers["X-Cache"] == "HIT"
+    assert len(adapter.requests) == 2
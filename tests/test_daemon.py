@@ -0,0 +1,94 @@
+import pytest
+
+from scrape_projects.valorant.daemon import IngestionDaemon
+from scrape_projects.valorant.datasources import (
+    VALORANT_MATCH_TEAM_RESULTS,
+    VALORANT_RESULTS_DATASOURCE,
+)
+from scrape_projects.valorant.match_index import MatchIndex
+from tests.fakes import FakeMatches, FakeTinybird, match_ids, result
+
+
+class FakeResults:
+    """
+    Results scraper serving a single page, newest first
+    """
+
+    def __init__(self, *items) -> None:
+        self.items = list(items)
+
+    def scrape_results_page(self, page):
+        return list(self.items) if page == 1 else []
+
+
+@pytest.fixture
+def tinybird():
+    return FakeTinybird()
+
+
+def test_failed_matches_and_results_are_retried(tinybird):
+    results, matches = FakeResults(result(2), result(1)), FakeMatches()
+    daemon = IngestionDaemon(results, matches, tinybird, seed=False)
+
+    matches.fail = {1}
+    tinybird.failing = {VALORANT_RESULTS_DATASOURCE.name}
+    daemon.poll()
+    # the results upload failed and match 1 could not be scraped
+    assert match_ids(daemon.matches_uploaded) == [2]
+    assert list(daemon.results_uploaded) == []
+
+    matches.fail, tinybird.failing = set(), set()
+    tinybird.rows.clear()
+    daemon.poll()
+    assert matches.scraped == [1, 2, 1]
+    assert match_ids(tinybird.uploaded(VALORANT_RESULTS_DATASOURCE, "link")) == [1, 2]
+    assert tinybird.uploaded(VALORANT_MATCH_TEAM_RESULTS, "match_id") == [1]
+
+    assert daemon.poll() == {}
+    assert matches.scraped == [1, 2, 1]
+
+
+def test_matches_are_retried_until_every_row_is_uploaded(tinybird):
+    results, matches = FakeResults(result(1)), FakeMatches()
+    daemon = IngestionDaemon(results, matches, tinybird, seed=False)
+
+    tinybird.failing = {VALORANT_MATCH_TEAM_RESULTS.name}
+    daemon.poll()
+    assert list(daemon.matches_uploaded) == []
+    assert match_ids(daemon.results_uploaded) == [1]
+
+    tinybird.failing = set()
+    daemon.poll()
+    assert matches.scraped == [1, 1]
+    assert tinybird.uploaded(VALORANT_MATCH_TEAM_RESULTS, "match_id") == [1]
+    assert match_ids(daemon.matches_uploaded) == [1]
+
+
+def test_seeding_scrapes_the_matches_missing_from_the_index(tinybird):
+    match_index = MatchIndex()
+    match_index.add_many({1: "hash"})
+    results = FakeResults(result(3, has_stats=False), result(2), result(1))
+    matches = FakeMatches(match_index)
+    daemon = IngestionDaemon(results, matches, tinybird)
+
+    assert daemon.poll() == {}
+    assert matches.scraped == []
+    assert match_ids(daemon.results_uploaded) == [1, 2, 3]
+
+    daemon.poll()
+    assert matches.scraped == [2]
+    assert VALORANT_RESULTS_DATASOURCE.name not in tinybird.rows
+    assert tinybird.uploaded(VALORANT_MATCH_TEAM_RESULTS, "match_id") == [2]
+    assert 2 in match_index
+
+
+def test_seeding_without_an_index_records_the_listed_matches(tinybird):
+    results, matches = FakeResults(result(2), result(1)), FakeMatches()
+    daemon = IngestionDaemon(results, matches, tinybird)
+
+    daemon.poll()
+    results.items.insert(0, result(0))
+    daemon.poll()
+
+    assert matches.scraped == [0]
+    assert match_ids(tinybird.uploaded(VALORANT_RESULTS_DATASOURCE, "link")) == [0]
@@ -0,0 +1,68 @@
+import pytest
+import time
+
+from requests import Session
+
+from scrape_projects.hedging import HedgingAdapter, mount_hedging
+from scrape_projects.ratelimit import AdaptiveRateLimiter, mount_rate_limiter
+from tests.fakes import URL, FakeAdapter
+
+
+def hedged_session(adapter, limiter, **options):
+    session = Session()
+    session.mount(URL, adapter)
+    options = {"min_samples": 2, "min_delay": 0.05, "max_hedge_ratio": 1.0} | options
+    mount_hedging(session, [URL], limiter=limiter, **options)
+    return mount_rate_limiter(session, limiter, [URL])
+
+
+def test_latencies_do_not_include_the_rate_limiter_wait():
+    # 5 requests per second, every request but the first waits for a token
+    limiter = AdaptiveRateLimiter("test", rate=5.0, burst=1.0)
+    session = hedged_session(FakeAdapter(), limiter)
+    for match_id in range(3):
+        session.get(f"{URL}/{match_id}/match")
+
+    hedging = session.get_adapter(URL).adapter
+    assert len(hedging.latencies) == 3
+    assert max(hedging.latencies) < 0.1
+
+
+@pytest.mark.parametrize("concurrency, hedged", [(2, True), (1, False)])
+def test_hedges_only_take_a_free_rate_limiter_slot(concurrency, hedged):
+    adapter = FakeAdapter(slow=[3])
+    limiter = AdaptiveRateLimiter(
+        "test", rate=100.0, concurrency=concurrency, max_concurrency=concurrency
+    )
+    session = hedged_session(adapter, limiter)
+    session.get(f"{URL}/1/match")
+    session.get(f"{URL}/2/match")
+
+    response = session.get(f"{URL}/3/match")
+    assert response.content == (b"4" if hedged else b"3")
+    assert adapter.sent == (4 if hedged else 3)
+    # the losing request is still on the wire and keeps its slot
+    assert limiter.in_flight == (1 if hedged else 0)
+
+    adapter.release.set()
+    deadline = time.monotonic() + 2
+    while limiter.in_flight and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert limiter.in_flight == 0
+
+
+def test_prefixes_share_one_hedging_adapter():
+    session = Session()
+    adapter = FakeAdapter()
+    prefixes = [URL, URL.replace("www.", "")]
+    for prefix in prefixes:
+        session.mount(prefix, adapter)
+    mount_hedging(session, prefixes)
+
+    hedging = session.get_adapter(prefixes[0])
+    assert isinstance(hedging, HedgingAdapter)
+    assert session.get_adapter(prefixes[1]) is hedging
+
+    session.mount(prefixes[1], FakeAdapter())
+    with pytest.raises(ValueError):
+        mount_hedging(session, prefixes)
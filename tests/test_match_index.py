@@ -0,0 +1,61 @@
+import pytest
+
+from scrape_projects.valorant.match_index import MatchIndex, match_content_hash
+
+
+def match(match_id: int, kills: int = 10):
+    return {
+        "match_id": match_id,
+        "games": [
+            {
+                "team_results": [{"match_id": match_id}],
+                "player_results": [{"match_id": match_id, "kills": kills}],
+            }
+        ],
+    }
+
+
+def test_added_matches_are_indexed_with_their_hash(tmp_path):
+    path = tmp_path / "index" / "matches.sqlite3"
+    match_index = MatchIndex(path)
+    match_index.add(1)
+    match_index.add_many({2: match_content_hash(match(2))})
+
+    assert 1 in match_index and 2 in match_index
+    assert 3 not in match_index
+    assert match_index.get_hash(1) is None
+    assert match_index.get_hash(2) == match_content_hash(match(2))
+    assert match_content_hash(match(2)) != match_content_hash(match(2, kills=11))
+    match_index.close()
+
+    # the index outlives the process
+    reopened = MatchIndex(path)
+    assert len(reopened) == 2
+    reopened.close()
+
+
+def test_rebuild_replaces_the_index_and_keeps_known_hashes():
+    match_index = MatchIndex()
+    match_index.add_many({1: "one", 2: "two"})
+
+    assert match_index.rebuild([2, 3, 3]) == 2
+    assert 1 not in match_index
+    assert match_index.get_hash(2) == "two"
+    assert match_index.get_hash(3) is None
+
+
+def test_failed_rebuild_leaves_the_index_untouched():
+    match_index = MatchIndex()
+    match_index.add_many({1: "one"})
+
+    def match_ids():
+        yield 2
+        raise KeyError("match_id")
+
+    with pytest.raises(KeyError):
+        match_index.rebuild(match_ids())
+    assert 1 in match_index and 2 not in match_index
+
+    assert match_index.rebuild([1, 4]) == 2
+    assert match_index.get_hash(1) == "one"
+    assert 4 in match_index
@@ -0,0 +1,134 @@
+import email.utils
+import pytest
+import time
+
+from requests import Session
+from requests.exceptions import ConnectionError
+
+from scrape_projects.metrics import metrics
+from scrape_projects.ratelimit import (
+    AdaptiveRateLimiter,
+    mount_rate_limiter,
+    parse_retry_after,
+)
+from tests.fakes import URL, FakeAdapter
+
+
+def limiter(**options) -> AdaptiveRateLimiter:
+    # fast enough that waiting for tokens does not slow the tests down
+    options = {"name": "test", "rate": 100.0, "penalty": 0.01} | options
+    return AdaptiveRateLimiter(**options)
+
+
+def test_successes_raise_rate_and_concurrency():
+    rate_limiter = limiter(rate=1.0, rate_step=0.5, concurrency=2, max_concurrency=3)
+    for _ in range(2):
+        rate_limiter.acquire()
+        rate_limiter.release(200, 0.1)
+
+    assert rate_limiter.rate == 2.0
+    assert rate_limiter.concurrency == 3
+    assert rate_limiter.in_flight == 0
+
+
+@pytest.mark.parametrize(
+    "status_code, latency", [(429, 0.1), (503, 0.1), (None, 0.1), (200, 10.0)]
+)
+def test_throttled_failed_and_slow_responses_halve_the_limits(status_code, latency):
+    rate_limiter = limiter(concurrency=8)
+    rate_limiter.acquire()
+    rate_limiter.release(status_code, latency)
+
+    assert rate_limiter.rate == 50.0
+    assert rate_limiter.concurrency == 4
+
+
+def test_limits_decrease_once_per_cooldown():
+    rate_limiter = limiter(concurrency=8, cooldown=0.2, min_rate=30.0)
+    for status_code in (429, 503):
+        rate_limiter.acquire()
+        rate_limiter.release(status_code, 0.1)
+    assert (rate_limiter.rate, rate_limiter.concurrency) == (50.0, 4)
+
+    time.sleep(0.25)
+    rate_limiter.acquire()
+    rate_limiter.release(429, 0.1)
+    # never below min_rate
+    assert (rate_limiter.rate, rate_limiter.concurrency) == (30.0, 2)
+
+
+def test_retry_after_pauses_every_request():
+    rate_limiter = limiter(cooldown=0)
+    rate_limiter.acquire()
+    rate_limiter.release(429, 0.1, retry_after=0.3)
+
+    assert rate_limiter.acquire() >= 0.29
+
+
+@pytest.mark.parametrize(
+    "value, seconds",
+    [
+        (None, None),
+        ("", None),
+        ("not a date", None),
+        ("7", 7.0),
+        (30, 30.0),
+        (-30, 0.0),
+    ],
+)
+def test_parse_retry_after(value, seconds):
+    if isinstance(value, int):
+        # http dates are built here, not when the tests are collected
+        value = email.utils.formatdate(time.time() + value, usegmt=True)
+    if seconds is None:
+        assert parse_retry_after(value) is None
+    else:
+        assert parse_retry_after(value) == pytest.approx(seconds, abs=1.5)
+
+
+def limited_session(adapter, **options):
+    session = Session()
+    session.mount(URL, adapter)
+    rate_limiter = limiter(**options)
+    return mount_rate_limiter(session, rate_limiter, [URL]), rate_limiter
+
+
+def test_throttled_requests_are_retried():
+    adapter = FakeAdapter(429, 503, 200, headers={"Retry-After": "0"})
+    session, rate_limiter = limited_session(adapter, cooldown=0)
+
+    assert session.get(f"{URL}/1").status_code == 200
+    assert adapter.sent == 3
+    assert rate_limiter.in_flight == 0
+
+
+def test_throttled_requests_give_up_after_max_retries():
+    adapter = FakeAdapter(*[429] * 4)
+    session, _ = limited_session(adapter, cooldown=0)
+
+    assert session.get(f"{URL}/1").status_code == 429
+    assert adapter.sent == 4
+
+
+def test_failed_requests_release_their_slot():
+    adapter = FakeAdapter(ConnectionError("reset"))
+    session, rate_limiter = limited_session(adapter)
+
+    with pytest.raises(ConnectionError):
+        session.get(f"{URL}/1")
+    assert rate_limiter.in_flight == 0
+    assert rate_limiter.rate == 50.0
+
+
+def test_backoffs_are_counted_by_a_fixed_set_of_reasons():
+    rate_limiter = limiter(name="labels", cooldown=0, slow_threshold=1.0)
+    for status_code, latency in [(429, 0.1), (None, 0.1), (200, 2.0), (200, 3.5)]:
+        rate_limiter.acquire()
+        rate_limiter.release(status_code, latency)
+
+    series = {
+        (series["labels"]["reason"], series["labels"]["status"]): series["value"]
+        for series in metrics.to_dict()["counters"]["ratelimit_throttled_total"]
+        if series["labels"]["limiter"] == "labels"
+    }
+    assert series == {("throttled", "429"): 1, ("error", ""): 1, ("slow", "200"): 2}
@@ -0,0 +1,152 @@
+import gzip
+import json
+import pytest
+import threading
+
+from requests import Response
+from requests.exceptions import ConnectionError, ReadTimeout
+from requests.structures import CaseInsensitiveDict
+
+from scrape_projects import tinybird
+from scrape_projects.tinybird import EventsUploader, upload_to_datasources
+
+
+def response(status_code=200, body=b"{}", headers=None):
+    response = Response()
+    response.status_code = status_code
+    response.headers = CaseInsensitiveDict(headers or {})
+    response._content = body
+    return response
+
+
+def inserted(rows, quarantined=0):
+    return response(
+        body=json.dumps(
+            {"successful_rows": rows - quarantined, "quarantined_rows": quarantined}
+        ).encode()
+    )
+
+
+class FakeApi:
+    """
+    Records the rows of every batch, answers are taken from the queued ones
+    (exceptions are raised) and default to every row being inserted
+    """
+
+    def __init__(self, *answers) -> None:
+        self.answers = list(answers)
+        self.batches = []
+        self._lock = threading.Lock()
+
+    def append_compressed_events(self, name, wait, data):
+        rows = gzip.decompress(data).decode().split("\n")
+        with self._lock:
+            self.batches.append((name, rows))
+            answer = self.answers.pop(0) if self.answers else inserted(len(rows))
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(tinybird.time, "sleep", sleeps.append)
+    return sleeps
+
+
+def test_batches_are_cut_by_row_count():
+    api = FakeApi()
+    summary = EventsUploader(api, "results", max_batch_rows=2).upload(
+        {"id": index} for index in range(5)
+    )
+
+    assert sorted(len(rows) for _, rows in api.batches) == [1, 2, 2]
+    assert summary["batches"] == 3
+    assert summary["successful_rows"] == 5
+
+
+def test_batches_are_cut_by_size():
+    api = FakeApi()
+    row = json.dumps({"id": "x" * 90})
+    # three 100 byte rows and their newlines fit in 310 bytes, a fourth does not
+    summary = EventsUploader(api, "results", max_batch_bytes=310).upload([row] * 7)
+
+    assert sorted(len(rows) for _, rows in api.batches) == [1, 3, 3]
+    assert all(rows == [row] * len(rows) for _, rows in api.batches)
+    assert summary["successful_rows"] == 7
+
+
+def test_retryable_failures_back_off_exponentially(sleeps):
+    api = FakeApi(response(500), ConnectionError("reset"), response(502))
+    summary = EventsUploader(api, "results", backoff=1.0).upload(["{}"])
+
+    assert sleeps == [1.0, 2.0, 4.0]
+    assert len(api.batches) == 4
+    assert summary["successful_rows"] == 1
+    assert summary["failed_rows"] == 0
+
+
+def test_retry_after_extends_the_backoff(sleeps):
+    api = FakeApi(
+        response(429, headers={"Retry-After": "7"}),
+        response(429, headers={"Retry-After": "1"}),
+    )
+    EventsUploader(api, "results", backoff=1.0).upload(["{}"])
+
+    assert sleeps == [7.0, 2.0]
+
+
+def test_batches_failing_every_retry_are_counted_as_failed(sleeps):
+    api = FakeApi(*[response(503)] * 3)
+    summary = EventsUploader(api, "results", max_retries=2).upload(["{}", "{}"])
+
+    assert len(sleeps) == 2
+    assert summary["failed_rows"] == 2
+    assert summary["successful_rows"] == 0
+
+
+def test_rejected_and_timed_out_batches_are_not_retried(sleeps):
+    api = FakeApi(response(400, body=b"bad row"), ReadTimeout("no answer"))
+    summary = EventsUploader(api, "results", max_batch_rows=1, max_in_flight=1).upload(
+        ["{}", "{}", "{}"]
+    )
+
+    assert sleeps == []
+    assert len(api.batches) == 3
+    assert summary["failed_rows"] == 2
+    assert summary["successful_rows"] == 1
+
+
+def test_undecodable_answers_are_not_retried(sleeps):
+    api = FakeApi(response(body=b"<html>"))
+    summary = EventsUploader(api, "results").upload(["{}", "{}"])
+
+    assert sleeps == []
+    assert len(api.batches) == 1
+    assert summary["successful_rows"] == 2
+
+
+def test_row_counts_are_summed_across_batches(sleeps):
+    api = FakeApi(inserted(2, quarantined=1), response(400), inserted(2))
+    summary = EventsUploader(api, "results", max_batch_rows=2, max_in_flight=1).upload(
+        ["{}"] * 6
+    )
+
+    assert summary == {
+        "batches": 3,
+        "successful_rows": 3,
+        "quarantined_rows": 1,
+        "failed_rows": 2,
+    }
+
+
+def test_rows_are_routed_to_their_datasources():
+    api = FakeApi()
+    summaries = upload_to_datasources(
+        api, [("teams", "{}"), ("players", "{}"), ("players", "{}")]
+    )
+
+    assert summaries["teams"]["successful_rows"] == 1
+    assert summaries["players"]["successful_rows"] == 2
+    assert sorted(name for name, _ in api.batches) == ["players", "teams"]